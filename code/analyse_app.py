@@ -6,13 +6,52 @@ Created on Thu Oct  3 22:34:54 2024
 """
 
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, filedialog
 import chess
+import chess.engine
 import chess.pgn
+import chess.polyglot
 from io import StringIO
-
-# Define the path to your Stockfish engine
-STOCKFISH_PATH = r"C:\Users\Robin Corbonnois\OneDrive - TBZ\Desktop\python\chessbot_project_2\github\code\stockfish\stockfish-windows-x86-64-avx2.exe"
+import os
+import queue
+import threading
+from engine_session import EngineSession
+from engine_pool import EnginePool
+from analysis_worker import AnalysisWorker
+from eval_cache import EvalCache, DEFAULT_CACHE_MB
+from analysis_store import AnalysisStore, engine_name
+from pgn_index import PgnIndex, SORT_COLUMNS
+from engine_config import load_config, open_settings_dialog
+from opening_book import OpeningBook
+from tablebase import TablebaseProber, WDL_NAMES
+from game_analysis import GameAnalysis, DEFAULT_WORKERS
+
+# Path to the Stockfish engine; if not set, the fastest binary for this CPU is located (see engine_locator.py)
+STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH")
+
+# A position snapshot is kept every SNAPSHOT_INTERVAL plies, so a jump costs at most that many pushes
+SNAPSHOT_INTERVAL = 16
+
+# Streamed engine results are applied at most once per frame (20 fps), however fast the engine reports
+ANALYSIS_FRAME_MS = 50
+
+# Progressive deepening: results shallower than QUICK_DEPTH are not drawn (too noisy); the search then
+# keeps deepening while the position is shown, until the time budget (seconds, adjustable) or node budget
+QUICK_DEPTH = 6
+ANALYSIS_TIME_BUDGET = 5
+ANALYSIS_NODE_BUDGET = None
+
+# Analysis panel: maximum number of lines and moves shown per line
+MAX_ANALYSIS_LINES = 5
+PANEL_PV_MOVES = 8
+
+# Evaluation graph of the whole game (size in pixels, evaluations clamped to +-GRAPH_CLAMP centipawns)
+GRAPH_WIDTH = 450
+GRAPH_HEIGHT = 100
+GRAPH_CLAMP = 1000
+
+# Games listed per page in the PGN game browser
+BROWSER_PAGE_SIZE = 200
 
 # Unicode symbols for chess pieces
 PIECE_SYMBOLS = {
@@ -35,13 +74,45 @@ class ChessApp:
         self.selected_square = None
         self.move_history = []  # Keeps track of the moves (PGN history)
         self.current_move_index = 0  # Tracks the current position in the move history
+        self.start_board = chess.Board()  # Start position of the loaded game (may be a custom FEN)
+        self.snapshots = {0: self.start_board.copy()}  # Ply -> board (with move stack) every SNAPSHOT_INTERVAL plies
         self.game = None  # Holds the PGN game object
         self.playing = False  # Keeps track of whether auto-play is active
+        self.engine_config = load_config()  # Threads/Hash/NUMA profiles (analysis profile used here)
+        # Warm engines shared by the live analysis and the whole-game workers (their Threads stay within the cores)
+        self.engine_pool = EnginePool(STOCKFISH_PATH, size=1 + DEFAULT_WORKERS)
+        self.engine_session = EngineSession(STOCKFISH_PATH, options=self.engine_config["analysis"],
+                                            pool=self.engine_pool)  # Leased lazily on the first evaluation
+        self.analysis_depth = 15  # Depth at which a cached or stored evaluation is final (no new search)
+        self.eval_cache = EvalCache(max_mb=DEFAULT_CACHE_MB)  # Positions already analysed, by Zobrist hash
+        try:
+            self.analysis_store = AnalysisStore()  # Evaluations from earlier sessions
+        except Exception as e:
+            print(f"Analysis store not available: {str(e)}")
+            self.analysis_store = None
+        try:
+            self.opening_book = OpeningBook()  # Known opening positions are not sent to the engine
+        except Exception as e:
+            print(f"Opening book not available: {str(e)}")
+            self.opening_book = None
+        self.book_moves = ""  # Book moves of the displayed position
+        self.tablebase = TablebaseProber(self.engine_config["analysis"].get("SyzygyPath"))  # Exact endgame results
+        self.analysis_worker = AnalysisWorker(self.engine_session, self.analysis_limit(ANALYSIS_TIME_BUDGET), min_depth=self.analysis_depth,
+                                              cache=self.eval_cache, store=self.analysis_store)
+        self.analysis_worker.start()
+        self.analysis_request = None  # Id of the evaluation the advantage bar is waiting for
+        self.analysis_polling = False  # Whether the root.after polling loop is active
+        self.analysis_shown_depth = 0  # Depth of the evaluation currently drawn
+        self.analysis_lines = {}  # multipv number -> latest info of the current request (analysis panel)
+        self.panel_dirty = False  # New lines arrived since the panel was last drawn
+        self.game_analysis = None  # Running GameAnalysis of the whole game
+        self.game_evals = []  # Per ply: None or (zobrist key, bar score in pawns, White centipawns for the graph)
 
         # Create canvas for the chessboard display
         self.canvas = tk.Canvas(self.root, width=450, height=450)  # Adjusted size for labels
         self.canvas.grid(row=0, column=0, padx=10)
         self.canvas.bind("<Button-1>", self.on_square_click)
+        self.create_board_scene()
 
         # Frame for controls and piece selection
         self.controls_frame = tk.Frame(self.root)
@@ -56,6 +127,13 @@ class ChessApp:
         self.advantage_bar_canvas = tk.Canvas(self.root, width=50, height=400, bg="gray")
         self.advantage_bar_canvas.grid(row=0, column=2)
 
+        self.create_analysis_panel()
+
+        # Evaluation graph of the whole game; a click jumps to that ply
+        self.graph_canvas = tk.Canvas(self.root, width=GRAPH_WIDTH, height=GRAPH_HEIGHT, bg="gray")
+        self.graph_canvas.grid(row=2, column=0, padx=10, pady=5)
+        self.graph_canvas.bind("<Button-1>", self.on_graph_click)
+
         # Label to display the advantage as a number
         self.advantage_label = tk.Label(self.controls_frame, text="Advantage: N/A", font=("Helvetica", 12))
         self.advantage_label.grid(row=15, column=0, pady=10)
@@ -95,6 +173,11 @@ class ChessApp:
         self.load_input_button = tk.Button(self.controls_frame, text="Load FEN/PGN", command=self.load_fen_or_pgn)
         self.load_input_button.grid(row=7, column=0, pady=5)
 
+        # Button to open a (large) PGN database file through its game index
+        self.open_pgn_button = tk.Button(self.controls_frame, text="Open PGN File", command=self.open_pgn_file)
+        self.open_pgn_button.grid(row=13, column=0, pady=5)
+        self.pgn_index = None  # PgnIndex of the opened database
+
         # Button to clear a piece
         self.clear_button = tk.Button(self.controls_frame, text="Clear Piece", command=self.clear_piece, state=tk.DISABLED)
         self.clear_button.grid(row=8, column=0, pady=5)
@@ -115,6 +198,15 @@ class ChessApp:
         self.flip_button = tk.Button(self.controls_frame, text="Flip Board", command=self.flip_board)
         self.flip_button.grid(row=12, column=0, pady=5)
 
+        # Engine settings (threads, hash size, NUMA policy)
+        self.settings_button = tk.Button(self.controls_frame, text="Engine Settings",
+                                         command=lambda: open_settings_dialog(self.root, self.engine_config, self.apply_engine_config))
+        self.settings_button.grid(row=19, column=0, pady=5)
+
+        # Evaluate every position of the loaded game in the background
+        self.analyse_game_button = tk.Button(self.controls_frame, text="Analyse Whole Game", command=self.analyse_whole_game)
+        self.analyse_game_button.grid(row=20, column=0, pady=5)
+
         # Initialize the chessboard
         self.update_board()
 
@@ -188,19 +280,25 @@ class ChessApp:
                 # If a square is already selected, attempt to move the piece to the clicked square
                 move = chess.Move(self.selected_square, square)
                 if move in self.board.legal_moves:
+                    # A new move replaces the rest of the history from this point on
+                    del self.move_history[self.current_move_index:]
+                    self.drop_snapshots_after(self.current_move_index)
+                    self.move_history.append(move)
                     self.board.push(move)
-                    self.move_history = self.board.move_stack[:]
-                    self.current_move_index = len(self.move_history)
+                    self.current_move_index += 1
+                    self.record_snapshot()
                 self.selected_square = None  # Reset selected square
 
         elif self.mode == "edit":
             # In "edit mode", place the selected piece on the board
             if self.selected_piece:
                 self.board.set_piece_at(square, chess.Piece.from_symbol(self.selected_piece))
+                self.set_start_position(self.board)
 
         elif self.mode == "clear":
             # In "clear mode", remove the piece from the clicked square
             self.board.remove_piece_at(square)
+            self.set_start_position(self.board)
 
         self.update_board()
         self.update_turn_label()
@@ -212,58 +310,200 @@ class ChessApp:
         else:
             self.turn_label.config(text="Black Turn", bg="black", fg="white")
 
-    def update_board(self):
-        """Updates the board display with the current position."""
+    def create_board_scene(self):
+        """Creates the squares and labels once; update_board only moves and relabels items."""
         square_size = 50
-        self.canvas.delete("all")  # Clear the canvas for redrawing
-
-        # Draw ranks (1-8) on the left side based on the flipped state
-        ranks = ['1', '2', '3', '4', '5', '6', '7', '8']
-        if self.flipped:
-            ranks.reverse()
-
-        # Draw ranks on the left
-        for i, rank_label in enumerate(ranks):
-            self.canvas.create_text(15, 25 + i * square_size + square_size // 2, text=rank_label, font=("Arial", 14))
+        self.rank_label_items = []
+        self.piece_items = {}  # Square -> canvas text item showing the piece on it
+        self.displayed_pieces = {}  # Square -> piece symbol currently drawn
+        self.piece_pool = []  # Hidden piece items ready for reuse
+        self.displayed_flipped = self.flipped
+
+        # Rank labels on the left (their text is swapped when the board is flipped)
+        for i in range(8):
+            self.rank_label_items.append(
+                self.canvas.create_text(15, 25 + i * square_size + square_size // 2, text="", font=("Arial", 14)))
+        self.update_rank_labels()
 
         # Draw files (a-h) at the bottom (no flipping)
         files = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
         for i, file_label in enumerate(files):
             self.canvas.create_text(25 + i * square_size + square_size // 2, 435, text=file_label, font=("Arial", 14))
 
-        # Draw the squares
+        # Draw the squares (a flip is a 180 degree turn, so the colours never change)
         for rank in range(8):
             for file in range(8):
                 color = "#F0D9B5" if (rank + file) % 2 == 0 else "#B58863"
-                if self.flipped:
-                    rank = 7 - rank  # Flip the rank if the board is flipped
                 self.canvas.create_rectangle(25 + file * square_size, 25 + rank * square_size,
                                              25 + (file + 1) * square_size, 25 + (rank + 1) * square_size,
                                              fill=color)
 
-        # Draw the pieces
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if piece:
-                piece_text = PIECE_SYMBOLS[piece.symbol()]
-                file = chess.square_file(square)
-                rank = 7 - chess.square_rank(square)
-
-                if self.flipped:
-                    file = 7 - file
-                    rank = 7 - rank
+    def update_rank_labels(self):
+        """Writes the rank numbers for the current orientation."""
+        ranks = ['1', '2', '3', '4', '5', '6', '7', '8']
+        if self.flipped:
+            ranks.reverse()
+        for item, rank_label in zip(self.rank_label_items, ranks):
+            self.canvas.itemconfigure(item, text=rank_label)
 
-                self.canvas.create_text(25 + file * square_size + square_size // 2,
-                                        25 + rank * square_size + square_size // 2,
-                                        text=piece_text, font=("Arial", 24))
+    def square_center(self, square):
+        """Canvas coordinates of the centre of a square for the current orientation."""
+        square_size = 50
+        file = chess.square_file(square)
+        rank = 7 - chess.square_rank(square)
+        if self.flipped:
+            file = 7 - file
+            rank = 7 - rank
+        return 25 + file * square_size + square_size // 2, 25 + rank * square_size + square_size // 2
 
-        # Update the advantage bar if enabled
-        if self.advantage_bar_enabled.get():
+    def update_board(self):
+        """Updates the board display; only squares whose piece changed are touched."""
+        # Flipping only remaps coordinates of the existing items
+        if self.flipped != self.displayed_flipped:
+            self.displayed_flipped = self.flipped
+            self.update_rank_labels()
+            for square, item in self.piece_items.items():
+                self.canvas.coords(item, *self.square_center(square))
+
+        position = {square: piece.symbol() for square, piece in self.board.piece_map().items()}
+
+        # Free the items of squares that were emptied or whose piece changed
+        freed = {}  # Piece symbol -> items no longer on their square
+        for square in [sq for sq, symbol in self.displayed_pieces.items() if position.get(sq) != symbol]:
+            freed.setdefault(self.displayed_pieces.pop(square), []).append(self.piece_items.pop(square))
+
+        # Place pieces on newly occupied squares, preferring an item that already shows the same glyph
+        for square, symbol in position.items():
+            if square in self.displayed_pieces:
+                continue
+            if freed.get(symbol):
+                item = freed[symbol].pop()  # The piece that moved: just move its item
+            else:
+                item = next((items.pop() for items in freed.values() if items), None)
+                if item is None:
+                    item = self.piece_pool.pop() if self.piece_pool else self.canvas.create_text(0, 0, font=("Arial", 24))
+                self.canvas.itemconfigure(item, text=PIECE_SYMBOLS[symbol], state=tk.NORMAL)
+            self.canvas.coords(item, *self.square_center(square))
+            self.piece_items[square] = item
+            self.displayed_pieces[square] = symbol
+
+        # Items that found no new square are hidden and kept for later
+        for items in freed.values():
+            for item in items:
+                self.canvas.itemconfigure(item, state=tk.HIDDEN)
+                self.piece_pool.append(item)
+
+        if self.game_evals:
+            self.draw_graph_marker()
+
+        # Update the advantage bar and analysis panel if enabled
+        if self.analysis_active():
             self.update_advantage_bar()
+        elif self.analysis_request is not None:
+            self.analysis_worker.cancel()
+            self.analysis_request = None
+
+    def analysis_active(self):
+        """True if the advantage bar or the analysis panel needs engine results."""
+        return self.advantage_bar_enabled.get() or self.analysis_panel_enabled.get()
+
+    def create_analysis_panel(self):
+        """Panel below the board with the top engine lines, updated while the search deepens."""
+        panel = tk.Frame(self.root)
+        panel.grid(row=1, column=0, columnspan=3, sticky="we", padx=10, pady=5)
+
+        self.analysis_panel_enabled = tk.BooleanVar()
+        tk.Checkbutton(panel, text="Show Analysis Lines", variable=self.analysis_panel_enabled,
+                       command=self.update_board).grid(row=0, column=0, sticky="w")
+        tk.Label(panel, text="Lines:").grid(row=0, column=1, padx=(10, 0))
+        self.analysis_line_count = tk.IntVar(value=3)
+        tk.Spinbox(panel, from_=1, to=MAX_ANALYSIS_LINES, width=3, textvariable=self.analysis_line_count,
+                   command=self.set_analysis_lines).grid(row=0, column=2)
+        tk.Button(panel, text="Stop", command=self.stop_analysis).grid(row=0, column=3, padx=10)
+        tk.Label(panel, text="Budget (s):").grid(row=0, column=4)
+        self.analysis_budget = tk.IntVar(value=ANALYSIS_TIME_BUDGET)
+        tk.Spinbox(panel, from_=1, to=600, width=4, textvariable=self.analysis_budget).grid(row=0, column=5)
+
+        self.analysis_status = tk.Label(panel, text="", font=("Helvetica", 10), anchor="w")
+        self.analysis_status.grid(row=1, column=0, columnspan=6, sticky="we")
+        self.analysis_text = tk.Text(panel, height=MAX_ANALYSIS_LINES, width=70, font=("Courier", 10), state=tk.DISABLED)
+        self.analysis_text.grid(row=2, column=0, columnspan=6, sticky="we")
+
+    def set_analysis_lines(self):
+        """Changes the number of lines (MultiPV) and restarts the analysis of the current position."""
+        self.analysis_worker.multipv = self.requested_lines()
+        if self.analysis_active():
+            self.evaluate_position()
+
+    @staticmethod
+    def analysis_limit(seconds):
+        """Budget of one progressive search: no depth limit, it deepens until time or nodes run out."""
+        return chess.engine.Limit(time=seconds, nodes=ANALYSIS_NODE_BUDGET)
+
+    def requested_budget(self):
+        """Time budget from the panel (the default when the entry is not a number)."""
+        try:
+            return max(1, self.analysis_budget.get())
+        except tk.TclError:
+            return ANALYSIS_TIME_BUDGET
+
+    def requested_lines(self):
+        """MultiPV wanted by the panel (1 when the panel is off or the entry is not a number)."""
+        if not self.analysis_panel_enabled.get():
+            return 1
+        try:
+            return max(1, min(MAX_ANALYSIS_LINES, self.analysis_line_count.get()))
+        except tk.TclError:
+            return 1
+
+    def stop_analysis(self):
+        """Stops the running search; the lines found so far stay on screen."""
+        if self.analysis_request is not None:
+            self.analysis_worker.cancel()
+            self.analysis_request = None
+            self.draw_analysis_panel(stopped=True)
+
+    def draw_analysis_panel(self, stopped=False):
+        """Redraws the panel from analysis_lines (called at most once per frame)."""
+        self.panel_dirty = False
+        enabled = self.analysis_panel_enabled.get()
+        lines = [self.analysis_lines[number] for number in sorted(self.analysis_lines)] if enabled else []
+        status = ""
+        if lines:
+            first = lines[0]
+            status = f"Depth {first.get('depth', 0)}"
+            if "nps" in first:
+                status += f"   {first['nps'] / 1000:.0f} kN/s"
+            if "nodes" in first:
+                status += f"   {first['nodes']:,} nodes"
+            if "hashfull" in first:
+                status += f"   Hash {first['hashfull'] / 10:.0f}%"
+        if stopped and enabled:
+            status += "   (stopped)"
+        if self.book_moves:
+            status = f"Book: {self.book_moves}   {status}".rstrip()
+        self.analysis_status.config(text=status)
+
+        self.analysis_text.configure(state=tk.NORMAL)
+        self.analysis_text.delete("1.0", tk.END)
+        for number, info in enumerate(lines, start=1):
+            score = info["score"].white()
+            score_text = f"#{score.mate()}" if score.is_mate() else f"{score.score() / 100:+.2f}"
+            try:
+                moves = self.board.variation_san(info.get("pv", [])[:PANEL_PV_MOVES])
+            except ValueError:
+                moves = ""  # Line for a position that is no longer on the board
+            self.analysis_text.insert(tk.END, f"{number}. {score_text:>7}  {moves}\n")
+        self.analysis_text.configure(state=tk.DISABLED)
 
     def update_advantage_bar(self):
-        """Updates the advantage bar based on Stockfish evaluation."""
-        score = self.evaluate_position()  # Retrieve score directly from Stockfish
+        """Requests a background evaluation; the bar is redrawn when results arrive."""
+        self.evaluate_position()
+
+    def draw_advantage_bar(self, score):
+        """Draws the advantage bar and label for a score in pawns."""
+        if not self.advantage_bar_enabled.get():
+            return  # Only the analysis panel is on
         self.advantage_bar_canvas.delete("all")
     
         # Advantage ranges from -80 (Black advantage) to +80 (White advantage)
@@ -282,45 +522,297 @@ class ChessApp:
         self.advantage_label.config(text=f"Advantage: {advantage_text}")
 
     def evaluate_position(self):
-        """Evaluates the current position using Stockfish and returns the advantage."""
-        try:
-            with chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH) as engine:
-                info = engine.analyse(self.board, chess.engine.Limit(depth=15))
-                score = info["score"].relative.score()
-                return score / 100 if score is not None else 0
-        except Exception as e:
-            print(f"Engine error: {str(e)}")
-            return 0  # If evaluation fails, return 0
+        """Shows a cached evaluation if there is one; otherwise (or if it is too shallow) starts a search."""
+        self.book_moves = self.opening_book.describe(self.board) if self.opening_book else ""
+        if self.show_tablebase_result() or self.show_game_eval():
+            return
+        entry = self.eval_cache.get(self.board)
+        self.analysis_shown_depth = 0  # Streamed results shallower than what is on screen are skipped
+        self.analysis_lines = {}
+        self.analysis_worker.multipv = self.requested_lines()
+        self.analysis_worker.limit = self.analysis_limit(self.requested_budget())
+        if entry is not None:
+            self.analysis_shown_depth = entry.depth
+            self.draw_advantage_bar(self.score_from_info({"score": entry.score}))
+            self.analysis_lines = {1: {"score": entry.score, "depth": entry.depth, "pv": entry.pv}}
+            self.draw_analysis_panel()
+            if entry.depth >= self.analysis_depth and self.analysis_worker.multipv == 1:
+                # Deep enough: no engine call needed, just drop any stale search
+                self.analysis_worker.cancel()
+                self.analysis_request = None
+                return
+        if self.book_moves:
+            # Book position: the engine is not asked; the book moves are shown with a cached or stored score
+            self.analysis_worker.cancel()
+            self.analysis_request = None
+            if entry is None:
+                self.show_stored_eval()
+            self.draw_analysis_panel()
+            return
+
+        # Submit to the analysis worker (a stale search is cancelled)
+        self.analysis_request = self.analysis_worker.submit(self.board)
+        if not self.analysis_polling:
+            self.analysis_polling = True
+            self.root.after(ANALYSIS_FRAME_MS, self.poll_analysis_results)
+
+    def show_stored_eval(self):
+        """Shows the analysis store's lines for the position without a search (equality if there are none)."""
+        engine = self.engine_session.engine  # The store is keyed by engine name; no engine is started for it
+        lines = None
+        if self.analysis_store is not None and engine is not None:
+            lines = self.analysis_store.lookup(self.board, engine_name(engine))
+        if not lines:
+            self.draw_advantage_bar(0)
+            self.advantage_label.config(text=f"Book: {self.book_moves}")
+            return
+        self.analysis_shown_depth = lines[0]["depth"]
+        self.draw_advantage_bar(self.score_from_info(lines[0]))
+        self.analysis_lines = dict(enumerate(lines[:self.analysis_worker.multipv], start=1))
+
+    def show_game_eval(self):
+        """Shows the precomputed whole-game evaluation of the current ply; False if there is none."""
+        if self.analysis_panel_enabled.get() or self.current_move_index >= len(self.game_evals):
+            return False  # The panel wants live lines
+        entry = self.game_evals[self.current_move_index]
+        if entry is None or entry[0] != chess.polyglot.zobrist_hash(self.board):
+            return False
+        self.analysis_worker.cancel()
+        self.analysis_request = None
+        self.draw_advantage_bar(entry[1])
+        return True
+
+    def analyse_whole_game(self):
+        """Starts (or stops) the background evaluation of every ply of the loaded game."""
+        if self.game_analysis is not None and self.game_analysis.running():
+            self.game_analysis.stop()
+            self.analyse_game_button.config(text="Analyse Whole Game")
+            return
+        boards = []
+        board = self.start_board.copy()
+        boards.append(board.copy())
+        for move in self.move_history:
+            board.push(move)
+            boards.append(board.copy(stack=False))
+        self.game_evals = [None] * len(boards)
+        # The live analysis gives its engine back so the game workers get its threads; it leases one again afterwards
+        self.analysis_worker.cancel()
+        self.analysis_request = None
+        self.engine_session.close()
+        options = dict(self.engine_config["analysis"])
+        workers = max(1, min(DEFAULT_WORKERS, int(options.get("Threads", 1))))
+        self.game_analysis = GameAnalysis(boards, chess.engine.Limit(depth=self.analysis_depth), STOCKFISH_PATH, options,
+                                          workers=workers, cache=self.eval_cache, store=self.analysis_store,
+                                          pool=self.engine_pool)
+        self.game_analysis.start()
+        self.analyse_game_button.config(text=f"Stop Analysis (0/{len(boards)})")
+        self.draw_eval_graph()
+        self.root.after(ANALYSIS_FRAME_MS, self.poll_game_analysis)
+
+    def poll_game_analysis(self):
+        """Moves finished plies into game_evals and redraws the graph once per frame."""
+        analysis = self.game_analysis
+        if analysis is None:
+            return
+        changed = False
+        while True:
+            try:
+                ply, info = analysis.results.get_nowait()
+            except queue.Empty:
+                break
+            board = analysis.boards[ply]
+            if info is None:
+                continue  # Engine error; the ply stays empty and is evaluated live when shown
+            if board.is_checkmate():
+                bar, white_cp = -80, (-GRAPH_CLAMP if board.turn == chess.WHITE else GRAPH_CLAMP)
+            elif "score" not in info:
+                bar, white_cp = 0, 0  # Stalemate or other draw
+            else:
+                bar = self.score_from_info(info)
+                white_cp = max(-GRAPH_CLAMP, min(GRAPH_CLAMP, info["score"].white().score(mate_score=GRAPH_CLAMP)))
+            if ply < len(self.game_evals):
+                self.game_evals[ply] = (chess.polyglot.zobrist_hash(board), bar, white_cp)
+                changed = True
+        done = sum(entry is not None for entry in self.game_evals)
+        if changed:
+            self.draw_eval_graph()
+        if analysis.running() or not analysis.results.empty():
+            self.analyse_game_button.config(text=f"Stop Analysis ({done}/{analysis.total})")
+            self.root.after(ANALYSIS_FRAME_MS, self.poll_game_analysis)
+        else:
+            self.analyse_game_button.config(text="Analyse Whole Game")
+
+    def draw_eval_graph(self):
+        """Draws White's evaluation per ply (above the middle line: White is better) and the current ply."""
+        self.graph_canvas.delete("all")
+        middle = GRAPH_HEIGHT / 2
+        self.graph_canvas.create_line(0, middle, GRAPH_WIDTH, middle, fill="dark gray")
+        plies = len(self.game_evals)
+        if plies == 0:
+            return
+        step = GRAPH_WIDTH / max(1, plies - 1)
+        points = []
+        for ply, entry in enumerate(self.game_evals):
+            if entry is None:
+                if len(points) >= 4:
+                    self.graph_canvas.create_line(*points, fill="white", width=2)
+                points = []
+                continue
+            points += [ply * step, middle - entry[2] / GRAPH_CLAMP * (middle - 2)]
+        if len(points) >= 4:
+            self.graph_canvas.create_line(*points, fill="white", width=2)
+        self.draw_graph_marker()
+
+    def draw_graph_marker(self):
+        """Vertical line at the ply shown on the board."""
+        self.graph_canvas.delete("marker")
+        plies = len(self.game_evals)
+        if plies:
+            x = self.current_move_index * GRAPH_WIDTH / max(1, plies - 1)
+            self.graph_canvas.create_line(x, 0, x, GRAPH_HEIGHT, fill="red", tags="marker")
+
+    def on_graph_click(self, event):
+        """Jumps to the ply under the mouse."""
+        plies = len(self.game_evals)
+        if plies == 0:
+            return
+        self.go_to_ply(round(event.x / GRAPH_WIDTH * (plies - 1)))
+        self.update_board()
+
+    def show_tablebase_result(self):
+        """Shows the exact result of a tablebase position without asking the engine; False if not in the tables."""
+        result = self.tablebase.probe(self.board) if self.tablebase else None
+        if result is None:
+            return False
+        self.analysis_worker.cancel()
+        self.analysis_request = None
+        # Only real wins fill the bar; wins spoiled by the 50-move rule are draws
+        score = 80 if result.wdl == 2 else -80 if result.wdl == -2 else 0
+        if self.board.turn == chess.BLACK:
+            score = -score
+        self.draw_advantage_bar(score)
+        if result.wdl == 0:
+            self.advantage_label.config(text="Tablebase: draw")
+        else:
+            side = "White" if self.board.turn == chess.WHITE else "Black"
+            self.advantage_label.config(text=f"Tablebase: {WDL_NAMES[result.wdl]} for {side} (DTZ {abs(result.dtz)})")
+        self.analysis_lines = {}
+        self.draw_analysis_panel()
+        self.analysis_status.config(text=self.advantage_label.cget("text"))
+        return True
+
+    def poll_analysis_results(self):
+        """Applies streamed engine results on the Tk thread and reschedules itself while a search runs."""
+        finished = False
+        score = None
+        while True:
+            try:
+                request_id, info, done = self.analysis_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if request_id != self.analysis_request:
+                continue  # Result for a position that is no longer displayed
+            finished = finished or done
+            if info is None:
+                if self.analysis_shown_depth == 0:
+                    score = 0  # If evaluation fails and nothing is cached, show 0
+            elif "score" not in info or (info.get("depth", 0) < QUICK_DEPTH and not done):
+                continue  # The first plies of a search are too shallow to show
+            elif info.get("multipv", 1) > 1:
+                self.analysis_lines[info["multipv"]] = info
+                self.panel_dirty = True
+            elif info.get("depth", 0) >= self.analysis_shown_depth:
+                score = self.score_from_info(info)
+                self.analysis_shown_depth = info.get("depth", 0)
+                self.analysis_lines[1] = info
+                self.panel_dirty = True
+
+        # Only the newest results of this frame are drawn
+        if score is not None and self.advantage_bar_enabled.get():
+            self.draw_advantage_bar(score)
+        if self.panel_dirty:
+            self.draw_analysis_panel()
+
+        if finished or self.analysis_request is None or not self.analysis_active():
+            self.analysis_polling = False
+        else:
+            self.root.after(ANALYSIS_FRAME_MS, self.poll_analysis_results)
+
+    @staticmethod
+    def score_from_info(info):
+        """Converts an engine info dict into the advantage in pawns."""
+        score = info["score"].relative.score()
+        return score / 100 if score is not None else 0
+
+    def set_start_position(self, board, moves=()):
+        """Makes board the root of the navigation history, followed by moves."""
+        self.start_board = board.copy(stack=False)
+        self.board = self.start_board.copy()
+        self.move_history = list(moves)
+        self.current_move_index = 0
+        self.build_snapshots()
+        if self.game_analysis is not None:
+            self.game_analysis.stop()
+            self.game_analysis = None
+            self.analyse_game_button.config(text="Analyse Whole Game")
+        self.game_evals = []
+        self.graph_canvas.delete("all")
+
+    def build_snapshots(self):
+        """Snapshots of the whole history in one pass, so even the first far jump is bounded."""
+        self.snapshots = {0: self.start_board.copy()}
+        board = self.start_board.copy()
+        for ply, move in enumerate(self.move_history, 1):
+            board.push(move)
+            if ply % SNAPSHOT_INTERVAL == 0:
+                self.snapshots[ply] = board.copy()
+
+    def record_snapshot(self):
+        """Stores a copy of the board if the current ply is a snapshot ply."""
+        if self.current_move_index % SNAPSHOT_INTERVAL == 0 and self.current_move_index not in self.snapshots:
+            self.snapshots[self.current_move_index] = self.board.copy()
+
+    def drop_snapshots_after(self, ply):
+        """Forgets snapshots beyond ply (the history after it is being replaced)."""
+        for snapshot_ply in [p for p in self.snapshots if p > ply]:
+            del self.snapshots[snapshot_ply]
+
+    def go_to_ply(self, ply):
+        """Moves the board to the given ply, stepping with push/pop or restoring the nearest snapshot."""
+        ply = max(0, min(ply, len(self.move_history)))
+        if abs(ply - self.current_move_index) > SNAPSHOT_INTERVAL:
+            # Far jump: restore the closest snapshot at or before the target ply
+            snapshot_ply = max(p for p in self.snapshots if p <= ply)
+            self.board = self.snapshots[snapshot_ply].copy()
+            self.current_move_index = snapshot_ply
+        while self.current_move_index > ply:
+            self.board.pop()
+            self.current_move_index -= 1
+        while self.current_move_index < ply:
+            self.board.push(self.move_history[self.current_move_index])
+            self.current_move_index += 1
+            self.record_snapshot()
 
     def previous_move(self):
         """Go back to the previous move in the game history."""
         if self.current_move_index > 0:
-            self.current_move_index -= 1
-            self.board.set_fen(chess.STARTING_FEN)
-            for move in self.move_history[:self.current_move_index]:
-                self.board.push(move)
+            self.go_to_ply(self.current_move_index - 1)
             self.update_board()
 
     def next_move(self):
         """Go forward to the next move in the game history."""
         if self.current_move_index < len(self.move_history):
-            move = self.move_history[self.current_move_index]
-            self.board.push(move)
-            self.current_move_index += 1
+            self.go_to_ply(self.current_move_index + 1)
             self.update_board()
 
     def go_to_first_move(self):
-        """Resets the board to the initial position (starting FEN)."""
-        self.current_move_index = 0
-        self.board.reset()
+        """Goes back to the start position of the loaded game."""
+        self.go_to_ply(0)
         self.update_board()
 
     def go_to_last_move(self):
-        """Plays all moves up to the last move in the move history."""
-        self.board.reset()
-        for move in self.move_history:
-            self.board.push(move)
-        self.current_move_index = len(self.move_history)
+        """Goes to the last move in the move history."""
+        self.go_to_ply(len(self.move_history))
         self.update_board()
 
     def toggle_play_pause(self):
@@ -346,6 +838,7 @@ class ChessApp:
     def clear_board(self):
         """Clears all pieces from the board."""
         self.board.clear()
+        self.set_start_position(self.board)
         self.update_board()
 
     def load_fen_or_pgn(self):
@@ -354,7 +847,7 @@ class ChessApp:
 
         # Try loading as FEN
         try:
-            self.board.set_fen(input_text)
+            self.set_start_position(chess.Board(input_text))
             self.update_board()
             return
         except ValueError:
@@ -363,19 +856,106 @@ class ChessApp:
         # Try loading as PGN
         try:
             pgn = StringIO(input_text)
-            self.game = chess.pgn.read_game(pgn)
-            self.board.reset()  # Reset the board to the initial state
-            self.move_history = list(self.game.mainline_moves())
-            self.current_move_index = 0  # Start from the beginning
-            self.update_board()
+            # Start from the game's own start position (honours a FEN header)
+            self.load_game(chess.pgn.read_game(pgn))
         except Exception:
             messagebox.showerror("Invalid Input", "Please enter a valid FEN or PGN string.")
 
+    def open_pgn_file(self):
+        """Asks for a PGN file and indexes it in the background (the index is reused next time)."""
+        path = filedialog.askopenfilename(title="Open PGN File", filetypes=[("PGN Files", "*.pgn"), ("All Files", "*.*")])
+        if not path:
+            return
+        self.open_pgn_button.config(state=tk.DISABLED, text="Indexing...")
+        result = {}
+
+        def build_index():
+            try:
+                result["index"] = PgnIndex(path)
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=build_index, daemon=True)
+        thread.start()
+        self.root.after(100, self.wait_for_pgn_index, thread, result)
+
+    def wait_for_pgn_index(self, thread, result):
+        """Polls the indexing thread and opens the game browser once it is done."""
+        if thread.is_alive():
+            self.root.after(100, self.wait_for_pgn_index, thread, result)
+            return
+        self.open_pgn_button.config(state=tk.NORMAL, text="Open PGN File")
+        if "error" in result:
+            messagebox.showerror("Invalid File", f"Could not read the PGN file: {result['error']}")
+            return
+        if self.pgn_index is not None:
+            self.pgn_index.close()
+        self.pgn_index = result["index"]
+        self.show_game_browser()
+
+    def show_game_browser(self):
+        """Window listing the games of the open PGN file, with a player filter and sorting."""
+        browser = tk.Toplevel(self.root)
+        browser.title(f"Games ({len(self.pgn_index)})")
+
+        filter_entry = tk.Entry(browser, width=30)
+        filter_entry.grid(row=0, column=0, padx=5, pady=5)
+        sort_column = tk.StringVar(value="id")
+        tk.OptionMenu(browser, sort_column, *SORT_COLUMNS).grid(row=0, column=1, padx=5, pady=5)
+
+        game_list = tk.Listbox(browser, width=70, height=20)
+        game_list.grid(row=1, column=0, columnspan=3, padx=5, pady=5)
+        game_ids = []
+        page = {"offset": 0, "total": 0}
+
+        # Paging: the query only ever returns one page of the (possibly huge) game list
+        page_bar = tk.Frame(browser)
+        page_bar.grid(row=2, column=0, columnspan=3, pady=5)
+        prev_button = tk.Button(page_bar, text="◀", width=3, command=lambda: show_page(page["offset"] - BROWSER_PAGE_SIZE))
+        prev_button.grid(row=0, column=0, padx=5)
+        page_label = tk.Label(page_bar, text="")
+        page_label.grid(row=0, column=1, padx=5)
+        next_button = tk.Button(page_bar, text="▶", width=3, command=lambda: show_page(page["offset"] + BROWSER_PAGE_SIZE))
+        next_button.grid(row=0, column=2, padx=5)
+
+        def show_page(offset):
+            text = filter_entry.get().strip()
+            page["offset"] = max(0, min(offset, page["total"] - 1)) // BROWSER_PAGE_SIZE * BROWSER_PAGE_SIZE
+            game_list.delete(0, tk.END)
+            game_ids.clear()
+            for row in self.pgn_index.query(text=text, order_by=sort_column.get(), limit=BROWSER_PAGE_SIZE, offset=page["offset"]):
+                game_ids.append(row["id"])
+                game_list.insert(tk.END, f"{row['white']} - {row['black']}  {row['result']}  {row['date']}  {row['eco'] or ''}")
+            first = page["offset"] + 1 if game_ids else 0
+            page_label.config(text=f"Games {first}-{page['offset'] + len(game_ids)} of {page['total']}")
+            prev_button.config(state=tk.NORMAL if page["offset"] > 0 else tk.DISABLED)
+            next_button.config(state=tk.NORMAL if page["offset"] + len(game_ids) < page["total"] else tk.DISABLED)
+
+        def refresh(*args):
+            page["total"] = self.pgn_index.count(text=filter_entry.get().strip())
+            show_page(0)
+
+        def open_selected(*args):
+            selection = game_list.curselection()
+            if selection:
+                self.load_game(self.pgn_index.read_game(game_ids[selection[0]]))
+
+        tk.Button(browser, text="Filter", command=refresh).grid(row=0, column=2, padx=5, pady=5)
+        filter_entry.bind("<Return>", refresh)
+        sort_column.trace_add("write", refresh)
+        game_list.bind("<Double-Button-1>", open_selected)
+        refresh()
+
+    def load_game(self, game):
+        """Shows a parsed PGN game from its start position."""
+        self.game = game
+        self.set_start_position(game.board(), game.mainline_moves())
+        self.update_board()
+        self.update_turn_label()
+
     def reset_board(self):
         """Resets the board to the default starting position."""
-        self.board.reset()
-        self.move_history = []
-        self.current_move_index = 0
+        self.set_start_position(chess.Board())
         self.update_board()
 
     def flip_board(self):
@@ -383,9 +963,38 @@ class ChessApp:
         self.flipped = not self.flipped
         self.update_board()
 
+    def apply_engine_config(self, config):
+        """Restarts the engine session with the new analysis profile."""
+        self.engine_config = config
+        self.analysis_worker.cancel()
+        self.analysis_request = None
+        self.engine_session.options = dict(config["analysis"])
+        self.engine_session.restart()
+        self.tablebase.close()
+        self.tablebase = TablebaseProber(config["analysis"].get("SyzygyPath"))
+        self.update_board()
+
+    def on_closing(self):
+        """Shuts down the engine session and closes the window."""
+        self.playing = False
+        self.analysis_worker.stop()
+        if self.game_analysis is not None:
+            self.game_analysis.stop()
+        self.engine_session.close()
+        self.engine_pool.close()
+        if self.analysis_store is not None:
+            self.analysis_store.close()
+        if self.pgn_index is not None:
+            self.pgn_index.close()
+        if self.opening_book is not None:
+            self.opening_book.close()
+        self.tablebase.close()
+        self.root.destroy()
+
 # Create the main window and run the app
 if __name__ == '__main__':
     root = tk.Tk()
-    ChessApp(root)
+    app = ChessApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent position-evaluation store (SQLite) shared by chessbot and analyse_app.
+
+Entries are keyed by the Zobrist hash of the position and by the engine name,
+so evaluations from a different engine build are never served.
+
+Usage from the command line:
+    python analysis_store.py export evals.jsonl
+    python analysis_store.py import evals.jsonl
+    python analysis_store.py compact [--keep-engine "Stockfish 17"]
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import chess
+import chess.engine
+import chess.polyglot
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".chessbot_br", "analysis_store.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    key INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    fen TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    lines TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (key, engine)
+)
+"""
+
+# Deeper results replace shallower ones, never the other way round
+UPSERT = """
+INSERT INTO evaluations (key, engine, fen, depth, lines, updated) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (key, engine) DO UPDATE SET
+    fen = excluded.fen, depth = excluded.depth, lines = excluded.lines, updated = excluded.updated
+WHERE excluded.depth >= evaluations.depth
+"""
+
+
+def position_key(board):
+    """Zobrist hash of board as a signed 64 bit integer (SQLite INTEGER range)."""
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+def engine_name(engine):
+    """Name and version reported by the engine (e.g. 'Stockfish 17'), used to tell builds apart."""
+    return engine.id.get("name", "unknown")
+
+
+def line_to_json(info):
+    """Converts one engine info dict (one multipv line) into plain JSON data."""
+    score = info["score"].white()
+    return {
+        "depth": info.get("depth", 0),
+        "cp": score.score(),
+        "mate": score.mate(),
+        "pv": [move.uci() for move in info.get("pv", [])],
+    }
+
+
+def line_from_json(line, board):
+    """Converts stored JSON data back into an engine info dict for board."""
+    if line["mate"] is not None:
+        score = chess.engine.Mate(line["mate"])
+    else:
+        score = chess.engine.Cp(line["cp"])
+    # Engines report scores from the side to move, so keep that point of view for .relative
+    relative = chess.engine.PovScore(score, chess.WHITE).pov(board.turn)
+    return {
+        "depth": line["depth"],
+        "score": chess.engine.PovScore(relative, board.turn),
+        "pv": [chess.Move.from_uci(move) for move in line["pv"]],
+    }
+
+
+class AnalysisStore:
+    """SQLite store of evaluations; reads are synchronous, writes go through a background thread."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.lock = threading.Lock()  # One connection, shared by readers and the writer thread
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def lookup(self, board, engine, min_depth=0, max_depth=None):
+        """Returns the stored multipv lines (engine info dicts) for board, or None.
+
+        Entries shallower than min_depth, or deeper than max_depth if given, are not returned."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fen, depth, lines FROM evaluations WHERE key = ? AND engine = ?",
+                (position_key(board), engine)).fetchone()
+        if row is None or row[1] < min_depth or (max_depth is not None and row[1] > max_depth):
+            return None
+        if row[0].split(" ")[:4] != board.fen().split(" ")[:4]:
+            return None  # Hash collision
+        return [line_from_json(line, board) for line in json.loads(row[2])]
+
+    def save(self, board, engine, infos):
+        """Queues the multipv lines of a finished search for writing; returns immediately."""
+        if isinstance(infos, dict):
+            infos = [infos]
+        lines = [line_to_json(info) for info in infos if "score" in info]
+        if lines:
+            depth = min(line["depth"] for line in lines)
+            self.writes.put((position_key(board), engine, board.fen(), depth, json.dumps(lines), time.time()))
+
+    def write_loop(self):
+        while True:
+            row = self.writes.get()
+            if row is None:
+                return
+            rows = [row]
+            while not self.writes.empty():  # Batch everything already queued into one transaction
+                row = self.writes.get()
+                if row is None:
+                    self.write_rows(rows)
+                    return
+                rows.append(row)
+            self.write_rows(rows)
+
+    def write_rows(self, rows):
+        with self.lock:
+            self.connection.executemany(UPSERT, rows)
+            self.connection.commit()
+
+    def export_jsonl(self, path):
+        """Writes every entry as one JSON object per line. Returns the number of entries."""
+        count = 0
+        with self.lock:
+            rows = self.connection.execute("SELECT engine, fen, depth, lines FROM evaluations").fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for engine, fen, depth, lines in rows:
+                f.write(json.dumps({"engine": engine, "fen": fen, "depth": depth, "lines": json.loads(lines)}) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, path):
+        """Merges entries from an export file (deeper entries win). Returns the number of lines read."""
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                board = chess.Board(entry["fen"])
+                rows.append((position_key(board), entry["engine"], entry["fen"], entry["depth"],
+                             json.dumps(entry["lines"]), time.time()))
+        self.write_rows(rows)
+        return len(rows)
+
+    def compact(self, keep_engine=None):
+        """Drops entries of other engine builds (if keep_engine is given) and reclaims disk space."""
+        with self.lock:
+            if keep_engine is not None:
+                self.connection.execute("DELETE FROM evaluations WHERE engine != ?", (keep_engine,))
+            self.connection.commit()
+            self.connection.execute("VACUUM")
+            return self.connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def close(self):
+        """Flushes pending writes and closes the database."""
+        self.writes.put(None)
+        self.writer.join()
+        with self.lock:
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the persistent analysis store.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Path of the SQLite store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export all entries to JSONL")
+    export_parser.add_argument("path")
+    import_parser = commands.add_parser("import", help="Import entries from JSONL")
+    import_parser.add_argument("path")
+    compact_parser = commands.add_parser("compact", help="Remove stale entries and vacuum the database")
+    compact_parser.add_argument("--keep-engine", help="Delete entries from every other engine build")
+    args = parser.parse_args()
+
+    store = AnalysisStore(args.store)
+    try:
+        if args.command == "export":
+            print(f"{store.export_jsonl(args.path)} entries exported.")
+        elif args.command == "import":
+            print(f"{store.import_jsonl(args.path)} entries imported.")
+        elif args.command == "compact":
+            print(f"{store.compact(args.keep_engine)} entries left.")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Background analysis for the Tk apps: the engine runs on a worker thread and
+results are handed back through a queue that the Tk loop polls with root.after.
+
+@author: Robin Corbonnois
+"""
+
+import queue
+import threading
+import chess
+import chess.engine
+from analysis_store import engine_name
+
+
+class AnalysisWorker(threading.Thread):
+    """Analyses the most recently submitted position; older requests are cancelled."""
+
+    def __init__(self, engine_session, limit, cache=None, store=None, multipv=1, min_depth=None):
+        super().__init__(daemon=True)
+        self.engine_session = engine_session
+        self.limit = limit  # Read at the start of each search, so it can be changed between requests
+        self.min_depth = limit.depth if min_depth is None else min_depth  # Stored results this deep are reused
+        self.multipv = multipv  # Number of lines; infos carry their line number in "multipv"
+        self.cache = cache  # Optional EvalCache; every streamed result is stored in it
+        self.store = store  # Optional AnalysisStore; consulted before and written after each search
+        self.results = queue.Queue()  # (request_id, info, finished) tuples for the Tk thread
+        self.condition = threading.Condition()
+        self.pending = None  # (request_id, board) waiting to be analysed
+        self.current = None  # Running chess.engine analysis, so it can be stopped
+        self.request_id = 0
+        self.running = True
+
+    def submit(self, board):
+        """Queues board for analysis and cancels whatever is still running. Returns the request id."""
+        with self.condition:
+            self.request_id += 1
+            self.pending = (self.request_id, board.copy())
+            if self.current is not None:
+                self.current.stop()  # Latest position wins
+            self.condition.notify()
+            return self.request_id
+
+    def cancel(self):
+        """Drops the pending request and stops the running search."""
+        with self.condition:
+            self.request_id += 1  # Makes every result still in flight stale
+            self.pending = None
+            if self.current is not None:
+                self.current.stop()
+
+    def stop(self):
+        """Stops the worker thread."""
+        with self.condition:
+            self.running = False
+            self.pending = None
+            if self.current is not None:
+                self.current.stop()
+            self.condition.notify()
+
+    def is_current(self, request_id):
+        """True if request_id is still the latest request."""
+        return request_id == self.request_id
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                request_id, board = self.pending
+                self.pending = None
+            self.analyse(request_id, board)
+
+    def analyse(self, request_id, board):
+        """Streams the engine output for one request into the result queue."""
+        multipv = self.multipv
+        limit = self.limit
+        try:
+            # Waiting for a pooled engine (e.g. behind the whole-game workers) ends when the request is outdated
+            engine = self.engine_session.get_engine(cancelled=lambda: not self.running or not self.is_current(request_id))
+            if self.store is not None and self.min_depth is not None:
+                lines = self.store.lookup(board, engine_name(engine), min_depth=self.min_depth)
+                if lines and len(lines) >= min(multipv, board.legal_moves.count()):
+                    # Already analysed deep enough in an earlier session
+                    if self.cache is not None:
+                        self.cache.put(board, lines[0])
+                    for number, line in enumerate(lines[1:multipv], start=2):
+                        self.results.put((request_id, dict(line, multipv=number), False))
+                    self.results.put((request_id, dict(lines[0], multipv=1), True))
+                    return
+            searcher = self.engine_session.searcher()
+            with searcher.analysis(board, limit, multipv=multipv if multipv > 1 else None) as analysis:
+                with self.condition:
+                    self.current = analysis
+                    if self.pending is not None or not self.running:
+                        analysis.stop()  # A newer request arrived before the search started
+                for info in analysis:
+                    if "score" in info:
+                        if self.cache is not None and info.get("multipv", 1) == 1:
+                            self.cache.put(board, info)
+                        self.results.put((request_id, dict(info), False))
+                # Also saved when stopped early (navigation): a partly refined result is still worth reusing
+                if self.store is not None and "score" in analysis.info:
+                    self.store.save(board, engine_name(engine), [info for info in analysis.multipv if "score" in info])
+                self.results.put((request_id, dict(analysis.info), True))
+        except chess.engine.EngineTerminatedError as e:
+            print(f"Engine error: {str(e)}")
+            self.engine_session.restart()
+            self.results.put((request_id, None, True))
+        except TimeoutError:
+            self.results.put((request_id, None, True))  # Cancelled while waiting for an engine
+        except Exception as e:
+            print(f"Engine error: {str(e)}")
+            self.results.put((request_id, None, True))
+        finally:
+            with self.condition:
+                self.current = None
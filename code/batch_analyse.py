@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch analysis of multi-game PGN files with a pool of engine processes.
+
+Example:
+    python batch_analyse.py club_games.pgn -o club_games.jsonl --engine ./stockfish --depth 15
+    python batch_analyse.py club_games.pgn -o annotated.pgn --format pgn --workers 8
+
+Without --engine the fastest Stockfish for this CPU is used (see engine_locator.py).
+Interrupted runs continue where they stopped: finished game numbers are kept
+in <output>.progress with the output size after each game, and skipped on the
+next run with the same output file. Output beyond the last recorded game is cut
+off first, so a game is never written twice.
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+import chess
+import chess.engine
+import chess.pgn
+from engine_locator import locate_engine
+
+# Evaluations are clamped to this many centipawns before computing the loss of a move
+EVAL_CLAMP = 1000
+MATE_SCORE = 10000
+
+# Centipawn loss thresholds (from the point of view of the side that moved)
+CLASSIFICATIONS = [(300, "blunder"), (100, "mistake"), (50, "inaccuracy")]
+CLASSIFICATION_NAGS = {"blunder": chess.pgn.NAG_BLUNDER, "mistake": chess.pgn.NAG_MISTAKE,
+                       "inaccuracy": chess.pgn.NAG_DUBIOUS_MOVE}
+
+# Games are read and sent to the pool in batches of this many games per worker
+GAMES_PER_WORKER = 4
+
+# Seconds one position may take before its engine counts as hung and is restarted
+POSITION_TIMEOUT = 60
+
+_engine = None  # Engine of the current pool worker process
+_engine_finalizer = None
+_engine_args = None  # (path, options) to restart the engine after a crash
+_limit = None
+_timeout = POSITION_TIMEOUT
+
+
+def init_worker(engine_path, limit_kwargs, options, timeout=POSITION_TIMEOUT):
+    """Pool initializer: starts one engine per worker process."""
+    global _engine_args, _limit, _timeout
+    _engine_args = (engine_path, options)
+    _limit = chess.engine.Limit(**limit_kwargs)
+    _timeout = timeout
+    start_engine()
+
+
+def start_engine():
+    """Starts the worker's engine, replacing a crashed one."""
+    global _engine, _engine_finalizer
+    if _engine is not None:
+        _engine_finalizer.cancel()
+        try:
+            _engine.close()
+        except Exception:
+            pass  # The process is already gone
+    engine_path, options = _engine_args
+    _engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    if options:
+        _engine.configure(options)
+    _engine_finalizer = multiprocessing.util.Finalize(_engine, _engine.quit, exitpriority=16)
+
+
+def analyse_position(fen):
+    """Pool task: returns (white POV centipawns, mate, best move UCI) for one position.
+
+    On an engine error or timeout, the engine is restarted and the position tried once more; None if that
+    fails too, so one bad position never aborts the batch."""
+    board = chess.Board(fen)
+    if board.is_game_over():
+        outcome = board.outcome()
+        if outcome.winner is None:
+            return 0, None, None
+        return (MATE_SCORE if outcome.winner == chess.WHITE else -MATE_SCORE), 0, None
+    for _ in range(2):
+        try:
+            info = analyse_with_timeout(board)
+            break
+        except (chess.engine.EngineError, TimeoutError):
+            try:
+                start_engine()  # Fresh process for the retry and the next tasks
+            except (chess.engine.EngineError, OSError):
+                return None  # Tried again with the next task
+    else:
+        return None
+    score = info["score"].white()
+    pv = info.get("pv")
+    return score.score(mate_score=MATE_SCORE), score.mate(), pv[0].uci() if pv else None
+
+
+def analyse_with_timeout(board):
+    """_engine.analyse, but raising TimeoutError after _timeout seconds.
+
+    SimpleEngine only bounds searches with a time limit; with depth or node limits a hung engine would block
+    the worker for good."""
+    coro = asyncio.wait_for(_engine.protocol.analyse(board, _limit), _timeout)
+    return asyncio.run_coroutine_threadsafe(coro, _engine.protocol.loop).result()
+
+
+def classify(loss):
+    for threshold, name in CLASSIFICATIONS:
+        if loss >= threshold:
+            return name
+    return None
+
+
+def game_positions(game):
+    """FENs of every position of the mainline, start position included."""
+    board = game.board()
+    fens = [board.fen()]
+    for move in game.mainline_moves():
+        board.push(move)
+        fens.append(board.fen())
+    return fens
+
+
+def build_report(game_index, game, evals):
+    """Combines the evaluations of all positions of a game into per-move records."""
+    board = game.board()
+    moves = []
+    for ply, move in enumerate(game.mainline_moves()):
+        before_cp, _, best_uci = evals[ply]
+        after_cp, after_mate, _ = evals[ply + 1]
+        sign = 1 if board.turn == chess.WHITE else -1
+        loss = sign * (max(-EVAL_CLAMP, min(EVAL_CLAMP, before_cp)) - max(-EVAL_CLAMP, min(EVAL_CLAMP, after_cp)))
+        best_move = chess.Move.from_uci(best_uci) if best_uci else None
+        record = {
+            "ply": ply + 1,
+            "move": board.san(move),
+            "eval_cp": after_cp,
+            "mate": after_mate,
+            "best_move": board.san(best_move) if best_move else None,
+            "loss_cp": max(0, loss),
+            "classification": classify(loss) if move != best_move else None,
+        }
+        moves.append(record)
+        board.push(move)
+    return {"game": game_index, "headers": dict(game.headers), "moves": moves}
+
+
+def annotate_game(game, report):
+    """Adds [%eval] comments and ?!/?/?? NAGs to the mainline of game."""
+    node = game
+    for record in report["moves"]:
+        node = node.variations[0]
+        if record["mate"] is not None:
+            node.set_eval(chess.engine.PovScore(chess.engine.Mate(record["mate"]), chess.WHITE))
+        else:
+            node.set_eval(chess.engine.PovScore(chess.engine.Cp(record["eval_cp"]), chess.WHITE))
+        if record["classification"]:
+            node.nags.add(CLASSIFICATION_NAGS[record["classification"]])
+            if record["best_move"]:
+                node.comment = f"{node.comment} {record['classification'].capitalize()}. Best was {record['best_move']}.".strip()
+    return game
+
+
+def read_progress(path):
+    """Finished game numbers and the output size after the last of them (None if not recorded)."""
+    done = set()
+    end = None
+    if os.path.exists(path):
+        end = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue  # Incomplete last line of an interrupted run
+                done.add(int(fields[0]))
+                end = int(fields[1])
+    return done, end
+
+
+def read_batch(pgn_file, start_index, batch_size, done):
+    """Reads up to batch_size games that are not finished yet. Returns (games, next index, eof)."""
+    games = []
+    index = start_index
+    while len(games) < batch_size:
+        if index in done:
+            if not chess.pgn.skip_game(pgn_file):
+                return games, index, True
+        else:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                return games, index, True
+            games.append((index, game))
+        index += 1
+    return games, index, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse every game of a PGN file with a pool of engines.")
+    parser.add_argument("pgn", help="Multi-game PGN file")
+    parser.add_argument("-o", "--output", required=True, help="Output file (JSONL or annotated PGN)")
+    parser.add_argument("--format", choices=["jsonl", "pgn"], default="jsonl")
+    parser.add_argument("--engine", help="Path of the UCI engine (default: fastest Stockfish for this CPU)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of engine processes")
+    parser.add_argument("--depth", type=int, default=15)
+    parser.add_argument("--nodes", type=int, help="Node limit per position (instead of depth)")
+    parser.add_argument("--hash", type=int, default=64, help="Hash size per engine in MB")
+    parser.add_argument("--timeout", type=float, default=POSITION_TIMEOUT,
+                        help="Seconds per position before the engine is restarted")
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if engine_path is None:
+        parser.error("no Stockfish binary found for this CPU, use --engine")
+    limit_kwargs = {"nodes": args.nodes} if args.nodes else {"depth": args.depth}
+    options = {"Threads": 1, "Hash": args.hash}  # One thread per process; parallelism comes from the pool
+    progress_path = args.output + ".progress"
+    done, end = read_progress(progress_path)
+    if done:
+        print(f"Resuming: {len(done)} games already analysed.")
+    if end is not None and os.path.exists(args.output) and os.path.getsize(args.output) > end:
+        with open(args.output, "r+b") as output:
+            output.truncate(end)  # Drop a game that was written but not recorded as finished
+
+    positions = 0
+    games_done = 0
+    start_time = time.monotonic()
+    initargs = (engine_path, limit_kwargs, options, args.timeout)
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=initargs) as pool, \
+            open(args.pgn, encoding="utf-8", errors="replace") as pgn_file, \
+            open(args.output, "ab") as output, \
+            open(progress_path, "a", encoding="utf-8") as progress:
+        index = 0
+        eof = False
+        while not eof:
+            games, index, eof = read_batch(pgn_file, index, args.workers * GAMES_PER_WORKER, done)
+            if not games:
+                continue
+            fens = [game_positions(game) for _, game in games]
+            evals = pool.map(analyse_position, [fen for game_fens in fens for fen in game_fens], chunksize=4)
+
+            offset = 0
+            for (game_index, game), game_fens in zip(games, fens):
+                game_evals = evals[offset:offset + len(game_fens)]
+                offset += len(game_fens)
+                if None in game_evals:
+                    print(f"Game {game_index}: the engine crashed twice, skipped (retried on the next run)")
+                    continue
+                report = build_report(game_index, game, game_evals)
+                if args.format == "jsonl":
+                    text = json.dumps(report) + "\n"
+                else:
+                    text = str(annotate_game(game, report)) + "\n\n"
+                output.write(text.encode("utf-8"))
+                output.flush()
+                # The game counts as finished together with the output size it ends at
+                progress.write(f"{game_index} {output.tell()}\n")
+                progress.flush()
+                games_done += 1
+
+            positions += offset
+            elapsed = time.monotonic() - start_time
+            print(f"{games_done} games, {positions} positions, {positions / elapsed:.1f} positions/s")
+
+        # Let the workers exit normally so their engines are quit (the with block would terminate them)
+        pool.close()
+        pool.join()
+
+    elapsed = time.monotonic() - start_time
+    if elapsed > 0 and positions:
+        print(f"Done: {games_done} games, {positions} positions in {elapsed:.1f} s ({positions / elapsed:.1f} positions/s)")
+
+
+if __name__ == "__main__":
+    main()
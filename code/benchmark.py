@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks of the two apps: board rendering, move handling,
+PGN loading/navigation and engine round-trips.
+
+Runs headless: by default Tk is replaced by a mock that draws nothing (this
+measures the Python side of every update); with --display the real Tk is used,
+e.g. under a virtual display:
+    xvfb-run python benchmark.py --display
+
+The engine is the UCI stub (uci_stub.py), so engine times are the round-trip
+cost, not a real search. The apps run with a fresh temporary profile, so local
+books, tables, stores and engine settings do not change the numbers.
+
+Results (milliseconds per operation, with percentiles) are written as JSON and
+compared against a stored baseline:
+    python benchmark.py -o result.json                 # compare with the baseline
+    python benchmark.py --save-baseline                # store this run as the baseline
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+from io import StringIO
+import chess
+import chess.engine
+import chess.pgn
+
+BASELINE_PATH = os.path.join(os.path.expanduser("~"), ".chessbot_br", "benchmark_baseline.json")
+STUB_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "uci_stub.py")]
+
+# Generated games when no PGN file is given (random legal moves, so every kind of move occurs)
+DEFAULT_GAMES = 4
+DEFAULT_PLIES = 300
+
+# A benchmark is reported as a regression when its median is this much slower than the baseline
+DEFAULT_TOLERANCE = 0.25
+
+# Each game is parsed and loaded this many times (one sample per game would give no percentiles)
+PGN_LOADS = 10
+
+PERCENTILES = [50, 90, 99]
+
+
+class MockWidget:
+    """Stands in for every Tk widget: keeps its options and canvas item ids, draws nothing."""
+
+    def __init__(self, *args, **options):
+        self.options = dict(options)
+        self.text = ""
+        self.last_item = 0
+
+    def __getattr__(self, name):
+        if name.startswith("create_"):
+            return self.create_item
+        if name.startswith("winfo_"):
+            return lambda *args: [] if name == "winfo_children" else 0
+        return lambda *args, **kwargs: None  # pack, grid, bind, delete, itemconfigure, coords, ...
+
+    def create_item(self, *args, **options):
+        self.last_item += 1
+        return self.last_item
+
+    def configure(self, cnf=None, **options):
+        self.options.update(cnf or {}, **options)
+
+    config = configure
+
+    def cget(self, key):
+        return self.options.get(key, "")
+
+    def insert(self, index, text, *tags):
+        self.text += str(text)
+
+    def get(self, *args):
+        return self.text
+
+    def after(self, ms, func=None, *args):
+        return "after#0"  # Callbacks are not run: there is no main loop
+
+
+class MockVariable:
+    def __init__(self, master=None, value=None, name=None):
+        self.value = self.default if value is None else value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+    def trace_add(self, mode, callback):
+        return "trace#0"
+
+
+def mock_variable(default):
+    return type("MockVariable", (MockVariable,), {"default": default})
+
+
+def mock_attribute(name, value):
+    if name.startswith("__"):
+        raise AttributeError(name)  # Keeps the import machinery from seeing a package
+    return value
+
+
+def install_mock_tk():
+    """Puts a tkinter replacement (and comtypes if it is missing) into sys.modules before the apps are imported."""
+    tk = types.ModuleType("tkinter")
+    tk.StringVar, tk.IntVar = mock_variable(""), mock_variable(0)
+    tk.BooleanVar, tk.DoubleVar = mock_variable(False), mock_variable(0.0)
+    tk.TclError = RuntimeError
+    # Constants (tk.END, tk.NORMAL, ...) are their lower-case names, like in Tk; Tk, Canvas, Button, ... are MockWidget
+    tk.__getattr__ = lambda name: mock_attribute(name, name.lower() if name.isupper() else MockWidget)
+    submodules = {
+        "messagebox": {"showinfo": None, "showerror": None, "showwarning": None, "askyesno": False},
+        "filedialog": {"askopenfilename": "", "asksaveasfilename": ""},
+        "scrolledtext": {},
+        "ttk": {},
+        "font": {},
+    }
+    for name, functions in submodules.items():
+        module = types.ModuleType(f"tkinter.{name}")
+        for function, result in functions.items():
+            setattr(module, function, lambda *args, result=result, **kwargs: result)
+        module.__getattr__ = lambda attribute: mock_attribute(attribute, MockWidget)  # ScrolledText, Combobox, ...
+        setattr(tk, name, module)
+        sys.modules[module.__name__] = module
+    sys.modules["tkinter"] = tk
+
+    try:
+        import comtypes.client  # noqa: F401  (only used for the Word documentation on Windows)
+    except ImportError:
+        comtypes = types.ModuleType("comtypes")
+        comtypes.client = types.ModuleType("comtypes.client")
+        sys.modules["comtypes"], sys.modules["comtypes.client"] = comtypes, comtypes.client
+
+
+def use_temporary_profile():
+    """Points the home directory to an empty temporary one (no book, tables, store or engine settings)."""
+    home = tempfile.mkdtemp(prefix="chessbot_bench_")
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    for name in ("CHESSBOT_BOOK", "CHESSBOT_SYZYGY", "STOCKFISH_PATH"):
+        os.environ.pop(name, None)
+    return home
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+def summarize(samples):
+    """Milliseconds per operation: count, mean, min, percentiles and max."""
+    values = sorted(samples)
+    stats = {"count": len(values), "mean": sum(values) / len(values), "min": values[0]}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = percentile(values, p)
+    stats["max"] = values[-1]
+    return stats
+
+
+def timed(func, *args):
+    """Runs func and returns its duration in milliseconds."""
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def random_game(rng, plies):
+    """A game of random legal moves (stops early at mate or a draw)."""
+    game = chess.pgn.Game()
+    node = game
+    board = chess.Board()
+    while board.ply() < plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        node = node.add_variation(move)
+        board.push(move)
+    return game
+
+
+def load_games(path, count, plies, seed):
+    """PGN texts of the benchmark games: from a file, or generated."""
+    if path:
+        texts = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while len(texts) < count:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                texts.append(str(game))
+        return texts
+    rng = random.Random(seed)
+    return [str(random_game(rng, plies)) for _ in range(count)]
+
+
+class Benchmarks:
+    """Creates both apps once and measures their operations over the benchmark games."""
+
+    def __init__(self, games):
+        self.games = [chess.pgn.read_game(StringIO(text)) for text in games]
+        self.texts = games
+        self.samples = {}
+
+        import analyse_app
+        import chessbot
+        self.tk = sys.modules["tkinter"]
+        chessbot.locate_engine = lambda *args: STUB_COMMAND
+        analyse_app.STOCKFISH_PATH = STUB_COMMAND
+        self.bot_root = self.new_root()
+        self.bot = chessbot.ChessApp(self.bot_root)
+        self.bot.engine_thread.join()
+        self.analysis_root = self.new_root()
+        self.analysis = analyse_app.ChessApp(self.analysis_root)
+
+    def new_root(self):
+        root = self.tk.Tk()
+        root.state = lambda *args: None  # 'zoomed' only exists on Windows
+        return root
+
+    def record(self, name, milliseconds):
+        self.samples.setdefault(name, []).append(milliseconds)
+
+    def refresh(self, root):
+        # With a real display the pending redraws belong to the measured operation
+        root.update_idletasks()
+
+    def boards(self, game):
+        board = game.board()
+        boards = [board.copy()]
+        for move in game.mainline_moves():
+            board.push(move)
+            boards.append(board.copy())
+        return boards
+
+    def run(self):
+        for game, text in zip(self.games, self.texts):
+            self.bench_chessbot_render(game)
+            self.bench_chessbot_moves(game)
+            self.bench_analyse_render(game)
+            self.bench_pgn(game, text)
+        self.bench_engine()
+        return {name: summarize(samples) for name, samples in self.samples.items()}
+
+    def bench_chessbot_render(self, game):
+        app = self.bot
+        for board in self.boards(game):
+            app.board = board
+            self.record("chessbot.update_board", timed(lambda: (app.update_board(), self.refresh(self.bot_root))))
+
+    def reset_chessbot(self, board):
+        app = self.bot
+        app.board = board
+        app.invalidate_move_index()
+        app.selected_piece = None
+        app.captured_pieces_player, app.captured_pieces_bot = [], []
+        app.game_mode.set("freund")
+        app.game_started = True
+        app.bot_thinking = False
+
+    def bench_chessbot_moves(self, game):
+        """Selecting a piece (highlight_moves) and moving it (handle_square_click -> push_move), as two clicks."""
+        app = self.bot
+        self.reset_chessbot(game.board())
+        for move in game.mainline_moves():
+            if move.promotion:
+                app.push_move(move)  # The promotion window needs a real click; not measured
+                continue
+            from_row, from_col = 7 - chess.square_rank(move.from_square), chess.square_file(move.from_square)
+            to_row, to_col = 7 - chess.square_rank(move.to_square), chess.square_file(move.to_square)
+            app.selected_piece = None  # The app keeps the last selection; a real first click would only clear it
+            self.record("chessbot.highlight_moves", timed(app.handle_square_click, from_row, from_col))
+            self.record("chessbot.handle_square_click", timed(lambda: (app.handle_square_click(to_row, to_col),
+                                                                        self.refresh(self.bot_root))))
+            if app.board.move_stack[-1] != move:
+                raise RuntimeError(f"Click benchmark lost the game at {move.uci()}")
+            app.game_started = True  # The end-of-game popup stops the game
+
+    def bench_analyse_render(self, game):
+        app = self.analysis
+        for board in self.boards(game):
+            app.board = board
+            self.record("analyse_app.update_board", timed(lambda: (app.update_board(), self.refresh(self.analysis_root))))
+
+    def bench_pgn(self, game, text):
+        """PGN parsing + loading, then stepping through the game and random jumps."""
+        app = self.analysis
+        for _ in range(PGN_LOADS):
+            self.record("pgn.load", timed(lambda: app.load_game(chess.pgn.read_game(StringIO(text)))))
+        plies = len(app.move_history)
+        for _ in range(plies):
+            self.record("pgn.next_move", timed(lambda: (app.next_move(), self.refresh(self.analysis_root))))
+        for _ in range(plies):
+            self.record("pgn.previous_move", timed(lambda: (app.previous_move(), self.refresh(self.analysis_root))))
+        rng = random.Random(plies)
+        for _ in range(plies):
+            ply = rng.randint(0, plies)
+            self.record("pgn.jump", timed(lambda: (app.go_to_ply(ply), app.update_board(), self.refresh(self.analysis_root))))
+
+    def bench_engine(self):
+        """Round-trips to the stub: a session analysis, a pool lease and a full bot search of chessbot."""
+        from engine_pool import EnginePool
+        from engine_session import EngineSession
+        boards = [board for game in self.games for board in self.boards(game) if not board.is_game_over()][:200]
+        session = EngineSession(STUB_COMMAND)
+        session.get_engine()
+        limit = chess.engine.Limit(depth=1)
+        for board in boards:
+            self.record("engine.analyse", timed(session.analyse, board, limit))
+        session.close()
+
+        pool = EnginePool(STUB_COMMAND, size=1)
+        pool.acquire().release()  # Starts the process
+        for _ in boards:
+            self.record("engine.pool_lease", timed(lambda: pool.acquire({"Threads": 1}).release()))
+        pool.close()
+
+        app = self.bot
+        app.bot_time_limit, app.bot_depth, app.bot_nodes = 0.1, 1, 1000
+        app.bot_tablebase, app.timed_game = False, False
+        for board in boards:
+            self.record("engine.bot_search", timed(app.search_bot_move, app.bot_search_id, board))
+            app.bot_results.get()
+
+    def close(self):
+        self.analysis.analysis_worker.stop()
+        self.analysis.engine_session.close()
+        self.analysis.engine_pool.close()
+        self.bot.engine_lease.release()
+        self.bot.engine_pool.close()
+        for app in (self.bot, self.analysis):
+            if app.analysis_store is not None:
+                app.analysis_store.close()
+
+
+def compare(results, baseline, tolerance):
+    """Benchmarks whose median is more than tolerance slower than in the baseline: [(name, ratio)]."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base and base["p50"] > 0:
+            ratio = stats["p50"] / base["p50"]
+            stats["baseline_p50"] = base["p50"]
+            stats["ratio"] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'Benchmark':<30} {'Count':>6} {'Mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'Max':>8} {'vs base':>8}")
+    for name, stats in sorted(results.items()):
+        ratio = f"{stats['ratio']:7.2f}x" if "ratio" in stats else f"{'-':>8}"
+        print(f"{name:<30} {stats['count']:>6} {stats['mean']:8.3f} {stats['p50']:8.3f} {stats['p90']:8.3f} "
+              f"{stats['p99']:8.3f} {stats['max']:8.3f} {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rendering, move handling and engine round-trips of the apps.")
+    parser.add_argument("--pgn", help="PGN file with the games to use (default: generated random games)")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="Number of games")
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="Length of generated games")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--display", action="store_true", help="Use the real Tk (needs a display, e.g. xvfb-run)")
+    parser.add_argument("-o", "--output", help="JSON file for the results")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown of the median (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if not args.display:
+        install_mock_tk()
+    texts = load_games(args.pgn, args.games, args.plies, args.seed)
+    home = use_temporary_profile()
+
+    # The apps print every click and move; keep that out of the terminal (its cost is still measured)
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        benchmarks = Benchmarks(texts)
+        try:
+            results = benchmarks.run()
+        finally:
+            benchmarks.close()
+            shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        "meta": {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "python_chess": chess.__version__,
+                 "tk": "real" if args.display else "mock", "games": len(texts), "pgn": args.pgn, "seed": args.seed},
+        "results": results,
+    }
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("tk") != report["meta"]["tk"]:
+            print(f"Baseline was measured with the {baseline['meta'].get('tk')} Tk; ratios are not comparable.")
+        regressions = compare(results, baseline, args.tolerance)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print()
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: median {ratio:.2f}x the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
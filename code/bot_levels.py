@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Difficulty levels of the bot and the engine limit of one bot search.
+
+Shared by the Tk app (chessbot.py) and the headless self-play harness
+(self_play.py), so both play with exactly the same settings.
+
+@author: Robin Corbonnois
+"""
+
+import chess
+import chess.engine
+
+# Engine settings per level: the search stops as soon as time, depth or nodes is reached.
+# Stockfish only accepts UCI_Elo from 1320, so "einfach" is weakened with Skill Level 0 instead.
+# book_depth: plies in which the opening book is consulted; book_exponent: 0 = all book moves equally often, higher = main lines
+# tablebase: endgames with few pieces are played perfectly from the Syzygy tables
+DIFFICULTY_SETTINGS = {
+    "einfach": {"elo": 800, "time": 0.2, "depth": 1, "nodes": 5000, "book_depth": 6, "book_exponent": 0, "tablebase": False,
+                "options": {"UCI_LimitStrength": False, "UCI_Elo": 1320, "Skill Level": 0}},
+    "mittel": {"elo": 1400, "time": 0.5, "depth": 3, "nodes": 50000, "book_depth": 12, "book_exponent": 1, "tablebase": True,
+               "options": {"UCI_LimitStrength": True, "UCI_Elo": 1400, "Skill Level": 20}},
+    "schwer": {"elo": 2000, "time": 1.0, "depth": 6, "nodes": 500000, "book_depth": 20, "book_exponent": 2, "tablebase": True,
+               "options": {"UCI_LimitStrength": True, "UCI_Elo": 2000, "Skill Level": 20}},
+}
+
+
+def search_limit(time_limit, depth, nodes, clock=None):
+    """Limit of a bot search: depth/nodes of the level, plus its fixed time or, with a GameClock, both clocks.
+
+    With the clocks the engine divides its time itself (time management)."""
+    if clock is not None:
+        return chess.engine.Limit(white_clock=clock.time_left(chess.WHITE), black_clock=clock.time_left(chess.BLACK),
+                                  white_inc=clock.increment[chess.WHITE], black_inc=clock.increment[chess.BLACK],
+                                  depth=depth, nodes=nodes)
+    return chess.engine.Limit(time=time_limit, depth=depth, nodes=nodes)
+
@@ -12,11 +12,29 @@ import chess  # Bibliothek für Schachlogik
 import chess.engine  # Modul für die Schach-Engine-Interaktion
 import os, sys  # Betriebssystem-Operationen und Dateipfade
 import threading  # Für Aufgaben im Hintergrund
+import queue  # Übergabe der Bot-Züge vom Engine-Thread an die Oberfläche
+import time  # Messung der Zeichenzeit des Bretts
 import comtypes.client  # Schnittstelle für Word-Integration
 import webbrowser  # Modul zum Öffnen von URLs im Browser
+from analysis_store import AnalysisStore, engine_name  # Gespeicherte Bewertungen aus früheren Sitzungen
+from engine_config import load_config, open_settings_dialog  # Threads/Hash/NUMA-Profile
+from engine_pool import EnginePool  # Warme Engine-Prozesse mit Optionsprofil je Ausleihe
+from engine_locator import locate_engine  # Wahl der schnellsten Engine für die CPU
+from game_clock import GameClock, format_time  # Schachuhr auf Basis von time.monotonic()
+from opening_book import OpeningBook  # Polyglot-Eröffnungsbuch vor der Engine-Suche
+from tablebase import TablebaseProber  # Syzygy-Endspieldatenbanken
+from bot_levels import DIFFICULTY_SETTINGS, search_limit  # Schwierigkeitsgrade (auch für self_play.py)
 
 VERSION = "chessbot platteforme v2"
 
+# Im Zeitspiel: geschätzte Anzahl verbleibender Züge für das Zeitbudget nach einem Ponderhit
+BOT_CLOCK_MOVES = 30
+
+# Bedenkzeit pro Seite im Zeitspiel (Sekunden), Inkrement und Verzögerung pro Zug
+GAME_SECONDS = 180
+GAME_INCREMENT = 0
+GAME_DELAY = 0
+
 class ChessApp:
     def __init__(self, root):
         # Initial setup für die ChessApp class
@@ -66,6 +84,7 @@ class ChessApp:
           'k': '♚'   # Schwarzer König
         }
         self.undo_stack = []  # Stack for undo moves
+        self.move_index = None  # Legal moves of the current position by from-square (built on demand)
         self.game_started = False  # Track if the game has started
         self.player_name = "Spieler 1"
         self.bot_name = "Bot"
@@ -75,15 +94,33 @@ class ChessApp:
         self.bot_elo = 1200
         self.player_time = None  # Player timer setting
         self.bot_time = None  # Bot timer setting
-        self.player_increment = 0  # Player increment per move
-        self.bot_increment = 0  # Bot increment per move
-        self.player_time_left = None
-        self.bot_time_left = None
-        self.player_timer_running = False
-        self.bot_timer_running = False
+        self.player_increment = GAME_INCREMENT  # Player increment per move
+        self.bot_increment = GAME_INCREMENT  # Bot increment per move
+        self.clock = None  # GameClock of a timed game (player = White, bot = Black)
+        self.clock_refresh = None  # after() id of the single clock display loop
         self.timed_game = False  # Track if the game is timed
         self.first_move_played = False  # Track if the first move has been played
         self.pawn_color = tk.StringVar(value="white")  # Track pawn color selection
+        self.engine_config = load_config()  # Der Bot nutzt das kleine "bot"-Profil
+        self.bot_options = {}  # Engine-Optionen der Stufe (UCI_Elo, Skill Level), gesetzt bei Spielstart
+        self.bot_thinking = False  # True while the engine searches the bot's move in the background
+        self.bot_search = None  # Running engine search, kept so it can be cancelled
+        self.bot_search_id = 0  # Incremented per search; results with an old id are discarded
+        self.bot_search_lock = threading.Lock()
+        self.bot_results = queue.Queue()  # (search_id, move, ponder_move, source, error) from the engine thread
+        self.ponder_move = None  # Expected reply of the player the bot is pondering on
+        self.ponder_started = None  # time.monotonic() when pondering began
+        try:
+            self.analysis_store = AnalysisStore()
+        except Exception as e:
+            print(f"[INFO] Analyse-Speicher nicht verfügbar: {e}")
+            self.analysis_store = None
+        try:
+            self.opening_book = OpeningBook()  # Leer, wenn keine Buchdatei vorhanden ist
+        except Exception as e:
+            print(f"[INFO] Eröffnungsbuch nicht verfügbar: {e}")
+            self.opening_book = None
+        self.tablebase = TablebaseProber(self.engine_config["bot"].get("SyzygyPath"))  # Leer ohne Tabellen
 
         # Create the user interface for the game
         self.create_game_interface()
@@ -153,14 +190,8 @@ class ChessApp:
         difficulty = self.game_mode.get()
     
         # Set bot parameters based on selected difficulty
-        if difficulty == "einfach":
-            self.bot_elo = 800
-            self.bot_name = "Bot"
-        elif difficulty == "mittel":
-            self.bot_elo = 1400
-            self.bot_name = "Bot"
-        elif difficulty == "schwer":
-            self.bot_elo = 2000
+        if difficulty in DIFFICULTY_SETTINGS:
+            self.bot_elo = DIFFICULTY_SETTINGS[difficulty]["elo"]
             self.bot_name = "Bot"
         elif difficulty == "freund":
             self.bot_name = "spieler 2"
@@ -198,18 +229,21 @@ class ChessApp:
         self.bot_name = "Bot"
     
         # Set bot parameters based on selected difficulty
-        if difficulty == "einfach":
-            self.bot_elo = 800
-            self.bot_time_limit = 0.2
-            self.bot_depth = 1
-        elif difficulty == "mittel":
-            self.bot_elo = 1400
-            self.bot_time_limit = 0.5
-            self.bot_depth = 3
-        elif difficulty == "schwer":
-            self.bot_elo = 2000
-            self.bot_time_limit = 1.0
-            self.bot_depth = 6
+        settings = DIFFICULTY_SETTINGS[difficulty]
+        self.bot_elo = settings["elo"]
+        self.bot_time_limit = settings["time"]
+        self.bot_depth = settings["depth"]
+        self.bot_nodes = settings["nodes"]
+        self.bot_book_depth = settings["book_depth"]
+        self.bot_book_exponent = settings["book_exponent"]
+        self.bot_tablebase = settings["tablebase"]
+        self.bot_options = settings["options"]
+        try:
+            options = dict(self.engine_config["bot"], **self.bot_options)  # Stärke auf Engine-Seite begrenzen
+            self.configure_engine(options)
+            self.engine_lease.new_game()  # Die erste Suche sendet ucinewgame (Hash und Verlauf der letzten Partie weg)
+        except chess.engine.EngineError as e:
+            print(f"[INFO] Engine-Optionen nicht gesetzt: {e}")
     
         # Update bot information in the GUI
         self.bot_name_label.configure(text=f"{self.bot_name} ({self.bot_elo})")
@@ -217,8 +251,7 @@ class ChessApp:
     
         # Initialize timers if the game is timed
         if self.timed_game:
-            self.player_time_left = 180  # 3 minutes
-            self.bot_time_left = 180  # 3 minutes
+            self.new_clock()
     
         # Output status message
         self.output_text.configure(state='normal')
@@ -243,26 +276,28 @@ class ChessApp:
 
         # Initialize timers if the game is timed
         if self.timed_game:
-            self.player_time_left = 180  # 3 minutes for Player 1
-            self.bot_time_left = 180  # 3 minutes for Player 2
+            self.new_clock()
 
         # Enable the game
         self.game_started = True
         self.enable_board()  # Enable the board after starting the game
 
     def load_engine(self):
-        # Utilisation d'un chemin fixe pour charger Stockfish
+        # Schnellste Stockfish-Version für diese CPU im Ordner stockfish suchen (Bauen: python engine_locator.py)
         base_path = os.path.dirname(os.path.abspath(__file__))
         if getattr(sys, 'frozen', False):  # Check if running as a bundled app
             # The application is frozen
             base_path = os.path.dirname(sys.executable)    
 
-        engine_path = os.path.join(base_path, "stockfish", "stockfish-windows-x86-64-avx2.exe")
+        engine_path = locate_engine(os.path.join(base_path, "stockfish"))
                 
         # Vérification si l'engine est disponible dans le chemin par défaut
-        if os.path.isfile(engine_path):
+        if engine_path is not None:
             try:
-                self.engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+                # Pool mit einem Prozess: die Engine wird beim Start geprüft und mit dem Bot-Profil ausgeliehen
+                self.engine_pool = EnginePool(engine_path, size=1)
+                self.engine_lease = self.engine_pool.acquire(self.engine_config["bot"])
+                self.engine = self.engine_lease.engine
                 self.output_text.configure(state='normal')
                 self.output_text.insert(tk.END, "\nSchach-Engine erfolgreich geladen!")
                 self.output_text.configure(state='disabled')
@@ -279,6 +314,31 @@ class ChessApp:
             self.output_text.configure(state='disabled')
             self.output_text.see(tk.END)
 
+    def apply_engine_config(self, config):
+        # Neue Engine-Einstellungen übernehmen (während der Bot rechnet erst beim nächsten Spielstart)
+        self.engine_config = config
+        if self.ponder_move is not None:
+            self.cancel_bot_move()  # Pondering would continue with the old options
+        # Neue Tabellen; die alten werden nicht geschlossen, ein laufender Such-Thread kann sie noch lesen
+        self.tablebase = TablebaseProber(config["bot"].get("SyzygyPath"))
+        if hasattr(self, 'engine') and not self.bot_thinking:
+            self.configure_engine(dict(config["bot"], **self.bot_options))
+
+    def configure_engine(self, options):
+        # Threads werden beim Ausleihen vergeben: bei einer Änderung die Engine zurückgeben und neu ausleihen
+        wanted = int(options.get("Threads", 1))
+        if min(wanted, self.engine_pool.max_threads) == self.engine_lease.threads:
+            self.engine_lease.configure(options)
+        else:
+            self.engine_lease.release()
+            self.engine_lease = self.engine_pool.acquire(options)  # Derselbe warme Prozess, Hash bleibt erhalten
+            self.engine = self.engine_lease.engine
+        if self.engine_lease.threads < wanted:
+            self.output_text.configure(state='normal')
+            self.output_text.insert(tk.END, f"\nThreads auf {self.engine_lease.threads} begrenzt (CPU-Kerne).")
+            self.output_text.configure(state='disabled')
+            self.output_text.see(tk.END)
+
     def browse_for_engine(self):
         # Function to prompt user to browse for the Stockfish engine
         return filedialog.askopenfilename(
@@ -416,8 +476,13 @@ class ChessApp:
         self.board_frame = tk.Frame(self.general_frame, bg="black")
         self.board_frame.grid(row=1, column=1, padx=5, pady=5, sticky="nsew")
     
-        # Create chessboard
+        # Create chessboard: every canvas item is created once here, update_board only reconfigures them
         self.square_size = 55  # Adjust size accordingly
+        self.piece_items = {}  # (row, col) -> id of the piece text item on that square
+        self.displayed_pieces = {}  # (row, col) -> piece symbol currently drawn (None = empty)
+        self.check_square = None  # (row, col) currently marked as king in check
+        self.highlighted_squares = set()  # Squares with a move-hint oval
+        self.render_stats = {"updates": 0, "changed_squares": 0, "last_ms": 0.0, "total_ms": 0.0}
         for row in range(8):
             for col in range(8):
                 square = tk.Canvas(self.board_frame, width=self.square_size, height=self.square_size, highlightthickness=0, bg="gray")
@@ -425,11 +490,13 @@ class ChessApp:
                 square.bind("<Button-1>", lambda event, r=row, c=col: self.handle_square_click(r, c))
                 self.squares[(row, col)] = square
                 color = "#D18B47" if (row + col) % 2 == 0 else "#FFCE9E"
-                square.create_rectangle(0, 0, self.square_size, self.square_size, outline="black", fill=color)
+                square.create_rectangle(0, 0, self.square_size, self.square_size, outline="black", fill=color, tags="square")
+                self.piece_items[(row, col)] = square.create_text(self.square_size // 2, self.square_size // 2, text="", font=("Arial", int(self.square_size * 0.5)), anchor="center", tags="piece")
+                self.displayed_pieces[(row, col)] = None
                 if row == 7:
-                    square.create_text(self.square_size - 10, self.square_size - 10, text=chr(97 + col), font=("Arial", 12), fill="white")
+                    square.create_text(self.square_size - 10, self.square_size - 10, text=chr(97 + col), font=("Arial", 12), fill="white", tags="notation")
                 if col == 0:
-                    square.create_text(10, 10, text=str(8 - row), font=("Arial", 12), fill="white")
+                    square.create_text(10, 10, text=str(8 - row), font=("Arial", 12), fill="white", tags="notation")
     
         # Frame above the output to hold buttons
         self.button_frame = tk.Frame(self.general_frame, bg="black")
@@ -441,6 +508,9 @@ class ChessApp:
     
         self.doku_button = tk.Button(self.button_frame, text="📝 Doku", font=("Arial", 16), bg="black", fg="white", command=self.open_documentation,borderwidth=0, relief=tk.FLAT)
         self.doku_button.pack(side=tk.LEFT, padx=10, pady=5)
+
+        self.settings_button = tk.Button(self.button_frame, text="⚙ Engine", font=("Arial", 16), bg="black", fg="white", command=lambda: open_settings_dialog(self.root, self.engine_config, self.apply_engine_config), borderwidth=0, relief=tk.FLAT)
+        self.settings_button.pack(side=tk.LEFT, padx=10, pady=5)
     
         # Text output frame - reduced size
         self.output_frame = tk.Frame(self.general_frame, bg="black")
@@ -464,54 +534,62 @@ class ChessApp:
         if not self.timed_button_active:
             self.timed_button_active = True
             self.timed_game = True
-            self.player_time_left = 180 if self.timed_button_active else None  # Set default time to 3 minutes
-            self.bot_time_left = 180 if self.timed_button_active else None
-            self.bot_clock_button.config(bg="orange", text="⏰ 03:00")
-            self.player_clock_button.config(bg="orange", text="⏰ 03:00")
+            self.new_clock()
+            self.bot_clock_button.config(bg="orange", text=f"⏰ {format_time(GAME_SECONDS)}")
+            self.player_clock_button.config(bg="orange", text=f"⏰ {format_time(GAME_SECONDS)}")
         else:
             self.timed_button_active = False
             self.timed_game = False
-            self.player_time_left = None
-            self.bot_time_left = None
+            self.stop_clock()
+            self.clock = None
             self.bot_clock_button.config(bg="red", text="⏰")
             self.player_clock_button.config(bg="red", text="⏰")
         self.update_timer_display('player')
         self.update_timer_display('bot')
 
     def update_board(self):
-        # Update the chessboard's visual representation
+        # Update the chessboard's visual representation: only squares whose piece changed are touched
+        start_time = time.perf_counter()
         self.pieces = {
             'r': '♜', 'n': '♞', 'b': '♝', 'q': '♛', 'k': '♚', 'p': '♟',
             'R': '♖', 'N': '♘', 'B': '♗', 'Q': '♕', 'K': '♔', 'P': '♙'
         }
-        
+
+        # Zughinweise der letzten Auswahl entfernen
+        for row_col in self.highlighted_squares:
+            self.squares[row_col].delete("highlight")
+        self.highlighted_squares.clear()
+
+        changed = 0
         for row in range(8):
             for col in range(8):
-                square = self.squares[(row, col)]
-                # Löschen Sie alle Figuren und Markierungen, aber behalten Sie die Notationen bei
-                square.delete("piece")  # Verwenden Sie eine Tag-basierte Löschung, damit die Notationen erhalten bleiben
-                
-                # Colorieren Sie die Schachfelder neu
-                color = "#D18B47" if (row + col) % 2 == 0 else "#FFCE9E"
-                square.create_rectangle(0, 0, self.square_size, self.square_size, outline="black", fill=color, tags="square")
-    
-                # Aktualisieren Sie das Brett mit Figuren
                 piece = self.board.piece_at(chess.square(col, 7 - row))
-                if piece:
-                    symbol = self.pieces[piece.symbol()]
-                    square.create_text(self.square_size // 2, self.square_size // 2, text=symbol, font=("Arial", int(self.square_size * 0.5)), anchor="center", tags="piece")
-                
-                # Zeichnen Sie die Notationen neu, falls es sich um die entsprechende Reihe oder Spalte handelt
-                if row == 7:  # Unten stehende Spaltenbezeichnungen (Buchstaben)
-                    square.create_text(self.square_size - 10, self.square_size - 10, text=chr(97 + col), font=("Arial", 12), fill="white", tags="notation")
-                if col == 0:  # Links stehende Zeilenbezeichnungen (Zahlen)
-                    square.create_text(10, 10, text=str(8 - row), font=("Arial", 12), fill="white", tags="notation")
-    
+                symbol = piece.symbol() if piece else None
+                if symbol != self.displayed_pieces[(row, col)]:
+                    # Nur die Figur auf diesem Feld neu beschriften, keine neuen Canvas-Elemente
+                    self.squares[(row, col)].itemconfigure(self.piece_items[(row, col)], text=self.pieces[symbol] if symbol else "")
+                    self.displayed_pieces[(row, col)] = symbol
+                    changed += 1
+
+        # Markieren Sie das bedrohte Königsfeld, wenn Schach vorliegt
+        check_square = None
         if self.board.is_check():
-            # Markieren Sie das bedrohte Königsfeld, wenn Schach vorliegt
             king_square = self.board.king(self.board.turn)
             row, col = divmod(king_square, 8)
-            self.squares[(7 - row, col)].create_rectangle(0, 0, self.square_size, self.square_size, outline="red", width=5, tags="check")
+            check_square = (7 - row, col)
+        if check_square != self.check_square:
+            if self.check_square is not None:
+                self.squares[self.check_square].delete("check")
+            if check_square is not None:
+                self.squares[check_square].create_rectangle(0, 0, self.square_size, self.square_size, outline="red", width=5, tags="check")
+            self.check_square = check_square
+
+        # Render cost of this update (see render_stats)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        self.render_stats["updates"] += 1
+        self.render_stats["changed_squares"] += changed
+        self.render_stats["last_ms"] = elapsed_ms
+        self.render_stats["total_ms"] += elapsed_ms
     
         # Update the piece banks (captured pieces)
         self.update_piece_banks()
@@ -555,7 +633,9 @@ class ChessApp:
   
     def reset_game(self):
         # Fonction pour réinitialiser le jeu
+        self.cancel_bot_move()
         self.board.reset()
+        self.invalidate_move_index()
         self.reset_piece_banks()
         self.update_board()
         self.disable_board()  # Désactivez l'échiquier
@@ -565,14 +645,12 @@ class ChessApp:
         self.undo_stack = []
         self.game_started = False
         self.first_move_played = False
-        self.player_timer_running = False
-        self.bot_timer_running = False
+        self.stop_clock()
         
         # Réinitialiser l'état des horloges
         self.timed_game = False
         self.timed_button_active = False
-        self.player_time_left = None
-        self.bot_time_left = None
+        self.clock = None
         
         # Conserver le mode de jeu sélectionné (ne pas réinitialiser game_mode)
         current_mode = self.game_mode.get()
@@ -609,52 +687,66 @@ class ChessApp:
         self.root.update_idletasks()
 
 
+    def new_clock(self):
+        # Neue Uhr für beide Seiten (läuft erst nach dem ersten Zug)
+        self.stop_clock()
+        self.clock = GameClock(GAME_SECONDS, delay=GAME_DELAY)
+        self.clock.set_increment(chess.WHITE, self.player_increment)
+        self.clock.set_increment(chess.BLACK, self.bot_increment)
+
+    def time_left(self, side):
+        # Restzeit einer Seite in Sekunden (None ohne Zeitspiel)
+        return self.clock.time_left(side) if self.clock is not None else None
+
     def start_timers(self):
-        # Start player or bot timers depending on whose turn it is
-        if self.board.turn == chess.WHITE:
-            self.start_player_timer()
-        else:
-            self.start_bot_timer()
-
-    def start_player_timer(self):
-        if self.player_time_left is not None and self.player_time_left > 0 and self.board.turn == chess.WHITE and self.game_started:
-            self.player_time_left -= 1
-            self.update_timer_display('player')
-            self.player_timer_running = True
-            self.root.after(1000, self.start_player_timer)  # Decrease by 1 second each time  # Decrease by 1 second each time
-        elif self.player_time_left == 0:
-            self.game_started = False
-            self.player_timer_running = False
-            if not hasattr(self, 'end_game_displayed') or not self.end_game_displayed:
-                self.end_game_displayed = True
-                self.display_end_game_popup("Schwarz hat gewonnen!", "durch Zeitablauf")
-
-    def start_bot_timer(self):
-        if self.bot_time_left is not None and self.bot_time_left > 0 and self.board.turn == chess.BLACK and self.game_started:
-            self.bot_time_left -= 1
-            self.update_timer_display('bot')
-            self.bot_timer_running = True
-            self.root.after(1000, self.start_bot_timer)  # Decrease by 1 second each time  # Decrease by 1 second each time
-        elif self.bot_time_left == 0:
+        # Start the clock of the side to move and the display loop
+        if self.clock is None:
+            return
+        self.clock.start(self.board.turn)
+        self.refresh_clock()
+
+    def stop_clock(self):
+        # Hält die Uhr an und beendet die Anzeige-Schleife
+        if self.clock is not None:
+            self.clock.stop()
+        if self.clock_refresh is not None:
+            self.root.after_cancel(self.clock_refresh)
+            self.clock_refresh = None
+
+    def refresh_clock(self):
+        # Einzige Anzeige-Schleife: die Zeit wird aus Zeitstempeln berechnet, verspätete Aufrufe verlieren nichts
+        if self.clock_refresh is not None:
+            self.root.after_cancel(self.clock_refresh)  # Direkter Aufruf (Zug): die geplante Runde ersetzen
+            self.clock_refresh = None
+        if self.clock is None:
+            return
+        self.update_timer_display('player')
+        self.update_timer_display('bot')
+        if not self.game_started or self.board.is_game_over():
+            self.clock.stop()
+            return
+        flagged = self.clock.flagged()
+        if flagged is not None:
+            self.clock.stop()
+            self.cancel_bot_move()
             self.game_started = False
-            self.bot_timer_running = False
             if not hasattr(self, 'end_game_displayed') or not self.end_game_displayed:
                 self.end_game_displayed = True
-                self.display_end_game_popup("Weiß hat gewonnen!", "durch Zeitablauf")
+                winner = "Schwarz" if flagged == chess.WHITE else "Weiß"
+                self.display_end_game_popup(f"{winner} hat gewonnen!", "durch Zeitablauf")
+            return
+        wait = self.clock.until_change()
+        if wait is not None:
+            # Nächster Aufruf genau dann, wenn sich die Anzeige ändert (Sekunden, in den letzten 10s Zehntel)
+            self.clock_refresh = self.root.after(max(10, int(wait * 1000) + 1), self.refresh_clock)
 
     def update_timer_display(self, player_type):
-        if player_type == 'player':
-            if self.player_time_left is not None:
-                minutes, seconds = divmod(self.player_time_left, 60)
-                self.player_clock_button.config(text=f"⏰ {minutes:02d}:{seconds:02d}", bg="white" if self.board.turn == chess.WHITE else "gray")
-            else:
-                self.player_clock_button.config(text="⏰", bg="red")
-        elif player_type == 'bot':
-            if self.bot_time_left is not None:
-                minutes, seconds = divmod(self.bot_time_left, 60)
-                self.bot_clock_button.config(text=f"⏰ {minutes:02d}:{seconds:02d}", bg="white" if self.board.turn == chess.BLACK else "gray")
-            else:
-                self.bot_clock_button.config(text="⏰", bg="red")
+        side = chess.WHITE if player_type == 'player' else chess.BLACK
+        button = self.player_clock_button if player_type == 'player' else self.bot_clock_button
+        if self.clock is not None:
+            button.config(text=f"⏰ {format_time(self.clock.time_left(side))}", bg="white" if self.board.turn == side else "gray")
+        else:
+            button.config(text="⏰", bg="red")
 
     def set_timer(self, player_type):
         # Set the timer for the player or bot
@@ -662,8 +754,8 @@ class ChessApp:
 
     def handle_square_click(self, row, col):
          # Handle click event for each square
-         if not self.game_started:
-             return  # Prevent moves before pressing play button
+         if not self.game_started or self.bot_thinking:
+             return  # Prevent moves before pressing play button or while the bot is thinking
      
          selected_square = chess.square(col, 7 - row)
          print(f"[DEBUG] Clicked on square: row={row}, col={col}, selected_square={selected_square}")  # Debugging
@@ -682,7 +774,7 @@ class ChessApp:
                      print(f"[DEBUG] Pawn promotion detected. Promotion move: {move}")
      
              # Check if the move is legal
-             if move in self.board.legal_moves:
+             if self.is_legal_move(move):
                  self.undo_stack.append(self.board.copy())  # Save the current state for undo
      
                  # Handle pawn promotion window if needed
@@ -810,6 +902,7 @@ class ChessApp:
     
         # Exécuter le coup sur le plateau
         self.board.push(move)  # Mettre à jour l'état du plateau
+        self.invalidate_move_index()
     
         # Afficher le coup dans la sortie, en passant la pièce d'origine
         self.display_move_in_output(move, from_piece)
@@ -827,58 +920,220 @@ class ChessApp:
         if not self.first_move_played:
             self.first_move_played = True
             if self.timed_game:
-                self.root.after(1000, self.start_timers)
+                self.start_timers()
 
 
     def make_move(self, move):
         # Aktualisiere das Brett mit dem neuen Zug
         self.board.push(move)
+        self.invalidate_move_index()
         # Dann die Anzeige des Zuges aktualisieren
         self.display_move_in_output(move)
 
     def switch_timer(self):
-        # Switch timers between player and bot
-        if self.player_timer_running:
-            self.player_timer_running = False
-            self.start_bot_timer()
-        elif self.bot_timer_running:
-            self.bot_timer_running = False
-            self.start_player_timer()
+        # Uhr auf die Seite am Zug umschalten (Zeit buchen, Inkrement gutschreiben); mehrfacher Aufruf schadet nicht
+        if self.clock is None or self.clock.running is None or self.clock.running == self.board.turn:
+            return
+        self.clock.press()
+        self.refresh_clock()
+
+    def legal_move_index(self):
+        # Legale Züge der Stellung nach Startfeld: {from_square: {to_square: [Züge, bei Umwandlung alle Varianten]}}
+        # Wird einmal pro Stellung aufgebaut; Auswahl, Markierung und Legalitätsprüfung sind dann Dictionary-Zugriffe
+        if self.move_index is None:
+            index = {}
+            for move in self.board.legal_moves:
+                index.setdefault(move.from_square, {}).setdefault(move.to_square, []).append(move)
+            self.move_index = index
+        return self.move_index
+
+    def invalidate_move_index(self):
+        # Nach jedem Zug, Zurücknehmen oder Zurücksetzen des Bretts aufrufen
+        self.move_index = None
+
+    def is_legal_move(self, move):
+        return move in self.legal_move_index().get(move.from_square, {}).get(move.to_square, ())
 
     def highlight_moves(self, square):
-        # Highlight possible moves for the selected piece
-        moves = list(self.board.legal_moves)
-        for move in moves:
-            if move.from_square == square:
-                row, col = divmod(move.to_square, 8)
-                self.squares[(7 - row, col)].create_oval(35, 35, self.square_size - 35, self.square_size - 35, fill="green", outline="")
+        # Highlight possible moves for the selected piece (one mark per target square, also for promotions)
+        for to_square in self.legal_move_index().get(square, {}):
+            row, col = divmod(to_square, 8)
+            self.squares[(7 - row, col)].create_oval(35, 35, self.square_size - 35, self.square_size - 35, fill="green", outline="", tags="highlight")
+            self.highlighted_squares.add((7 - row, col))
 
     def bot_move(self):
-        # Let the bot make a move using the engine
-        result = self.engine.play(self.board, chess.engine.Limit(time=self.bot_time_limit))
-    
+        # Startet die Suche des Bots in einem Hintergrund-Thread, damit die Oberfläche bedienbar bleibt
+        book_move = self.book_move()
+        if book_move is not None:
+            # Buchzug: sofort spielen, die Engine wird nicht gefragt
+            if self.ponder_move is not None:
+                self.cancel_bot_move()
+            self.apply_bot_move(book_move, source="book")
+            return
+        if self.ponder_move is not None:
+            if self.board.move_stack and self.board.peek() == self.ponder_move:
+                self.ponder_hit()
+                return
+            self.cancel_bot_move()  # Falsche Stellung vorbereitet: abbrechen und neu suchen
+        with self.bot_search_lock:
+            self.bot_search_id += 1
+            search_id = self.bot_search_id
+        self.bot_thinking = True
+        board = self.board.copy()
+        threading.Thread(target=self.search_bot_move, args=(search_id, board), daemon=True).start()
+        self.root.after(50, self.poll_bot_move)
+
+    def search_bot_move(self, search_id, board, ponder=False):
+        # Läuft im Engine-Thread: sucht den Zug und legt ihn in die Queue (kein Tk-Zugriff hier)
+        try:
+            # Endspiel in den Tabellen: exakter Zug ohne Engine-Suche
+            if self.bot_tablebase and self.tablebase.covers(board):
+                move = self.tablebase.best_move(board)
+                if move is not None:
+                    self.bot_results.put((search_id, move, None, "tablebase", None))
+                    return
+
+            # Zuerst im Speicher nachschauen: eine Bewertung genau in der Tiefe der Stufe ist das, was die eigene Suche fände
+            # (tiefere Analysen aus analyse_app würden den Bot stärker machen als seine Stufe)
+            if self.analysis_store is not None:
+                lines = self.analysis_store.lookup(board, engine_name(self.engine), min_depth=self.bot_depth,
+                                                   max_depth=self.bot_depth)
+                if lines and lines[0]["pv"]:
+                    pv = lines[0]["pv"]
+                    self.bot_results.put((search_id, pv[0], pv[1] if len(pv) > 1 else None, "store", None))
+                    return
+
+            with self.engine_lease.analysis(board, self.bot_search_limit(ponder)) as search:
+                with self.bot_search_lock:
+                    self.bot_search = search
+                    if search_id != self.bot_search_id:
+                        search.stop()  # Already cancelled before the search started
+                best = search.wait()
+            if self.analysis_store is not None and "score" in search.info:
+                self.analysis_store.save(board, engine_name(self.engine), search.info)  # Asynchron gespeichert
+            self.bot_results.put((search_id, best.move, best.ponder, "engine", None))
+        except Exception as e:
+            self.bot_results.put((search_id, None, None, None, e))
+        finally:
+            with self.bot_search_lock:
+                if search_id == self.bot_search_id:
+                    self.bot_search = None
+
+    def book_move(self):
+        # Zug aus dem Eröffnungsbuch (gewichtete Zufallswahl je nach Stufe) oder None
+        if not self.opening_book:
+            return None
+        return self.opening_book.choose(self.board, exponent=self.bot_book_exponent, depth=self.bot_book_depth)
+
+    def bot_search_limit(self, ponder=False):
+        # Tiefe/Knoten je nach Stufe; im Zeitspiel teilt die Engine ihre Uhr selbst ein (timeman)
+        if ponder:
+            # Auf der Zeit des Spielers: nur Tiefe/Knoten begrenzen, die Zeit wird erst beim Ponderhit gezählt
+            return chess.engine.Limit(depth=self.bot_depth, nodes=self.bot_nodes)
+        clock = self.clock if self.timed_game else None
+        return search_limit(self.bot_time_limit, self.bot_depth, self.bot_nodes, clock)
+
+    def bot_time_budget(self):
+        # Zeit für einen Zug nach einem Ponderhit (ohne Uhr: fester Wert der Stufe)
+        if self.timed_game and self.clock is not None:
+            return self.time_left(chess.BLACK) / BOT_CLOCK_MOVES + self.bot_increment
+        return self.bot_time_limit
+
+    def poll_bot_move(self):
+        # Prüft im Tk-Thread, ob der Bot-Zug fertig ist
+        while True:
+            try:
+                search_id, move, ponder_move, source, error = self.bot_results.get_nowait()
+            except queue.Empty:
+                break
+            if search_id != self.bot_search_id:
+                continue  # Result of a cancelled search
+            self.bot_thinking = False
+            if error is not None or move is None:
+                self.output_text.configure(state='normal')
+                self.output_text.insert(tk.END, f"\nFehler bei der Engine-Suche: {error}")
+                self.output_text.configure(state='disabled')
+                self.output_text.see(tk.END)
+            else:
+                self.apply_bot_move(move, source=source)
+                self.start_pondering(ponder_move)
+            return
+        if self.bot_thinking:
+            self.root.after(50, self.poll_bot_move)
+
+    def start_pondering(self, ponder_move):
+        # Während der Spieler überlegt, sucht der Bot schon auf der erwarteten Antwort weiter
+        if ponder_move is None or not self.game_started or self.game_mode.get() == "freund":
+            return
+        if self.board.is_game_over() or not self.is_legal_move(ponder_move):
+            return
+        board = self.board.copy()
+        board.push(ponder_move)
+        with self.bot_search_lock:
+            self.bot_search_id += 1
+            search_id = self.bot_search_id
+        self.ponder_move = ponder_move
+        self.ponder_started = time.monotonic()
+        threading.Thread(target=self.search_bot_move, args=(search_id, board, True), daemon=True).start()
+
+    def ponder_hit(self):
+        # Der Spieler hat den erwarteten Zug gespielt: die laufende (oder fertige) Suche wird übernommen
+        pondered = time.monotonic() - self.ponder_started
+        self.ponder_move = None
+        self.bot_thinking = True
+        # Rest des Zeitbudgets; die Bedenkzeit des Spielers zählt wie beim UCI-Ponderhit mit
+        remaining = max(0.0, self.bot_time_budget() - pondered)
+        search_id = self.bot_search_id
+        self.root.after(int(remaining * 1000), lambda: self.stop_bot_search(search_id))
+        self.poll_bot_move()
+
+    def stop_bot_search(self, search_id):
+        # Beendet die Suche mit dem besten Zug bis jetzt (falls sie noch läuft)
+        with self.bot_search_lock:
+            search = self.bot_search if search_id == self.bot_search_id else None
+        if search is not None:
+            try:
+                search.stop()
+            except Exception:
+                pass  # Engine already stopped
+
+    def cancel_bot_move(self):
+        # Bricht eine laufende Bot-Suche oder das Pondern ab (Reset, Aufgeben, Schliessen, Ponder miss)
+        with self.bot_search_lock:
+            self.bot_search_id += 1
+            search, self.bot_search = self.bot_search, None
+        self.bot_thinking = False
+        self.ponder_move = None
+        if search is not None:
+            try:
+                search.stop()
+            except Exception:
+                pass  # Engine already stopped
+
+    def apply_bot_move(self, move, source="engine"):
         # Handle bot promotion (automatically promote to Queen)
-        if self.board.piece_at(result.move.from_square).piece_type == chess.PAWN and (
-                chess.square_rank(result.move.to_square) == 0 or chess.square_rank(result.move.to_square) == 7):
-            result.move = chess.Move(result.move.from_square, result.move.to_square, promotion=chess.QUEEN)
+        if self.board.piece_at(move.from_square).piece_type == chess.PAWN and (
+                chess.square_rank(move.to_square) == 0 or chess.square_rank(move.to_square) == 7):
+            move = chess.Move(move.from_square, move.to_square, promotion=chess.QUEEN)
     
         # Handle capture
-        if self.board.is_capture(result.move):
-            captured_piece = self.board.piece_at(result.move.to_square)
+        if self.board.is_capture(move):
+            captured_piece = self.board.piece_at(move.to_square)
             if captured_piece is not None:
                 self.captured_pieces_player.append(captured_piece.symbol())
         
         # Push the move
-        self.board.push(result.move)
+        self.board.push(move)
+        self.invalidate_move_index()
         self.update_board()
-        self.display_move_in_output(result.move)  # Display bot's move
+        self.display_move_in_output(move, note=" 📖" if source == "book" else "")  # Display bot's move (📖 = Buchzug)
         self.check_end_game()
         
         # Switch timer if timed game
         if self.timed_game:
             self.switch_timer()
 
-    def display_move_in_output(self, move, from_piece=None):
+    def display_move_in_output(self, move, from_piece=None, note=""):
         # Ajouter deux lignes vides seulement au début de l'affichage des mouvements
         if len(self.board.move_stack) == 1:
             # Si c'est le premier mouvement, ajoute deux lignes vides pour espacer
@@ -921,6 +1176,7 @@ class ChessApp:
             display_move += '#'
         elif self.board.is_check():
             display_move += '+'
+        display_move += note  # Herkunft des Zugs (z. B. Eröffnungsbuch)
     
         # Déterminer si c'est le tour des Blancs ou des Noirs
         move_number = (len(self.board.move_stack) + 1) // 2
@@ -1018,8 +1274,15 @@ class ChessApp:
 
     def on_closing(self):
         # Handle the closing event
+        self.cancel_bot_move()
         if hasattr(self, 'engine') and self.engine:
-            self.engine.quit()
+            self.engine_lease.release()
+            self.engine_pool.close()  # Beendet den zurückgegebenen Prozess
+        if self.analysis_store is not None:
+            self.analysis_store.close()
+        if self.opening_book is not None:
+            self.opening_book.close()
+        self.tablebase.close()
         self.root.destroy()
         messagebox.showinfo("Auf Wiedersehen", "Das Programm wird jetzt beendet.")
 
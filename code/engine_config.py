@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Engine configuration profiles (Threads, Hash, NUMA policy) per use case.
+
+The profiles are stored in a JSON file; missing values are filled in from the
+detected hardware, so an analysis box uses all its cores while the bot keeps
+a small footprint.
+
+@author: Robin Corbonnois
+"""
+
+import json
+import os
+import sys
+from tablebase import DEFAULT_SYZYGY_PATH, syzygy_directories
+
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".chessbot_br", "engine_config.json")
+
+# Use cases with their own profile
+PROFILES = ["analysis", "bot"]
+
+# Options shown in the settings dialog
+PROFILE_OPTIONS = ["Threads", "Hash", "NumaPolicy", "SyzygyPath"]
+
+MAX_AUTO_HASH_MB = 16384
+
+
+def detect_cores():
+    return os.cpu_count() or 1
+
+
+def detect_memory_mb():
+    """Physical memory in MB (0 if it cannot be determined)."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+            return status.ullTotalPhys // (1024 * 1024)
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def default_profiles(cores=None, memory_mb=None):
+    """Profiles derived from the hardware: analysis gets most of the machine, the bot very little."""
+    cores = detect_cores() if cores is None else cores
+    memory_mb = detect_memory_mb() if memory_mb is None else memory_mb
+    # A quarter of the RAM, rounded down to a power of two, for the analysis hash table
+    hash_mb = 16
+    while hash_mb * 2 <= min(memory_mb // 4, MAX_AUTO_HASH_MB):
+        hash_mb *= 2
+    # Tablebases are used when the default directory holds tables ('<empty>' is Stockfish's "none")
+    syzygy_path = DEFAULT_SYZYGY_PATH if syzygy_directories(DEFAULT_SYZYGY_PATH) else "<empty>"
+    return {
+        "analysis": {"Threads": max(1, cores - 1), "Hash": hash_mb, "NumaPolicy": "auto", "SyzygyPath": syzygy_path},
+        "bot": {"Threads": 1, "Hash": 16, "NumaPolicy": "none", "SyzygyPath": syzygy_path},
+    }
+
+
+def load_config(path=CONFIG_PATH):
+    """Profiles from the config file, completed with the hardware defaults."""
+    config = default_profiles()
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Engine config ignored: {str(e)}")
+            stored = {}
+        for profile, options in stored.items():
+            config.setdefault(profile, {}).update(options)
+    return config
+
+
+def save_config(config, path=CONFIG_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+
+def supported_options(engine, options):
+    """Keeps only the options the running engine knows (other engines may lack e.g. NumaPolicy)."""
+    return {name: value for name, value in options.items() if name in engine.options}
+
+
+def open_settings_dialog(parent, config, on_save):
+    """Tk dialog to edit the profiles; on_save(config) is called after the file was written."""
+    import tkinter as tk
+    from tkinter import messagebox
+
+    dialog = tk.Toplevel(parent)
+    dialog.title("Engine Settings")
+    tk.Label(dialog, text=f"{detect_cores()} cores, {detect_memory_mb()} MB RAM detected").grid(
+        row=0, column=0, columnspan=len(PROFILES) + 1, padx=5, pady=5)
+
+    variables = {}
+    for column, profile in enumerate(PROFILES, start=1):
+        tk.Label(dialog, text=profile.capitalize(), font=("Helvetica", 12, "bold")).grid(row=1, column=column, padx=5)
+    for row, option in enumerate(PROFILE_OPTIONS, start=2):
+        tk.Label(dialog, text=option).grid(row=row, column=0, sticky="w", padx=5)
+        for column, profile in enumerate(PROFILES, start=1):
+            variable = tk.StringVar(value=str(config[profile].get(option, "")))
+            tk.Entry(dialog, textvariable=variable, width=10).grid(row=row, column=column, padx=5, pady=2)
+            variables[(profile, option)] = variable
+
+    def save():
+        try:
+            values = {key: int(variable.get()) if key[1] in ("Threads", "Hash") else variable.get().strip()
+                      for key, variable in variables.items()}
+        except ValueError:
+            messagebox.showerror("Invalid Value", "Threads and Hash must be whole numbers.", parent=dialog)
+            return
+        for (profile, option), value in values.items():
+            config[profile][option] = value
+        save_config(config)
+        on_save(config)
+        dialog.destroy()
+
+    tk.Button(dialog, text="Save", command=save).grid(row=len(PROFILE_OPTIONS) + 2, column=0,
+                                                       columnspan=len(PROFILES) + 1, pady=5)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Finds the fastest Stockfish binary the CPU supports.
+
+The CPU features (avx2, bmi2, avx512, vnni) decide the list of usable ARCH
+targets, fastest first. The engine directory is searched for a matching
+release binary (e.g. stockfish-ubuntu-x86-64-avx2), then the cache directory
+for an earlier build. The apps only look up binaries; building the vendored
+sources in code/stockfish/src with the matching ARCH= and recording the
+`bench` speed in engine_build.json are explicit steps of the command line.
+
+Usage from the command line:
+    python engine_locator.py [--engine-dir DIR] [--no-build] [--rebench]
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".chessbot_br", "engines")
+RECORD_PATH = os.path.join(CACHE_DIR, "engine_build.json")
+
+# Stockfish ARCH targets, fastest first, with the CPU flags (from /proc/cpuinfo) each one needs
+X86_ARCHS = [
+    ("x86-64-vnni512", {"avx512f", "avx512bw", "avx512_vnni", "avx512dq", "avx512vl"}),
+    ("x86-64-avx512", {"avx512f", "avx512bw"}),
+    ("x86-64-avxvnni", {"avx_vnni", "avx2", "bmi2"}),
+    ("x86-64-bmi2", {"avx2", "bmi2"}),
+    ("x86-64-avx2", {"avx2"}),
+    ("x86-64-sse41-popcnt", {"sse4_1", "popcnt"}),
+    ("x86-64", set()),
+]
+ARM_ARCHS = [
+    ("armv8-dotprod", {"asimddp"}),
+    ("armv8", set()),
+]
+
+BENCH_TIMEOUT = 300  # Seconds
+
+# Located engine per engine directory; the lock serialises lookups from the app and the worker threads
+_located = {}
+_locate_lock = threading.Lock()
+
+
+def default_engine_dir():
+    """The stockfish folder next to the app (or next to the executable when bundled)."""
+    if getattr(sys, 'frozen', False):
+        base_path = os.path.dirname(sys.executable)
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, "stockfish")
+
+
+def cpu_flags():
+    """CPU feature flags of this machine (empty set if unknown)."""
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/cpuinfo", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("flags") or line.startswith("Features"):
+                        return set(line.split(":", 1)[1].split())
+        except OSError:
+            pass
+    elif sys.platform == "win32":
+        import ctypes
+        flags = set()
+        # PF_SSE4_1 = 37, PF_AVX2 = 40, PF_AVX512F = 41 (IsProcessorFeaturePresent)
+        for feature, names in ((37, {"sse4_1", "popcnt"}), (40, {"avx2"}), (41, {"avx512f", "avx512bw"})):
+            if ctypes.windll.kernel32.IsProcessorFeaturePresent(feature):
+                flags |= names
+        return flags
+    return set()
+
+
+def supported_archs(flags=None):
+    """ARCH targets this CPU can run, fastest first."""
+    flags = cpu_flags() if flags is None else flags
+    machine = platform.machine().lower()
+    archs = ARM_ARCHS if machine in ("aarch64", "arm64") else X86_ARCHS
+    return [arch for arch, needed in archs if needed <= flags]
+
+
+def find_binary(engine_dir, archs):
+    """Returns (path, arch) of the fastest matching binary in engine_dir, or (None, None)."""
+    if not os.path.isdir(engine_dir):
+        return None, None
+    names = [name for name in os.listdir(engine_dir)
+             if name.lower().startswith("stockfish") and os.path.isfile(os.path.join(engine_dir, name))]
+    for arch in archs:
+        for name in sorted(names):
+            stem = name[:-4] if name.lower().endswith(".exe") else name
+            if stem.endswith("-" + arch) and os.access(os.path.join(engine_dir, name), os.X_OK):
+                return os.path.join(engine_dir, name), arch
+    # Last resort when the CPU features are unknown (e.g. older Windows): any Stockfish binary in the folder
+    for name in sorted(names):
+        if os.access(os.path.join(engine_dir, name), os.X_OK) and (os.name != "nt" or name.lower().endswith(".exe")):
+            return os.path.join(engine_dir, name), None
+    return None, None
+
+
+def build_engine(arch, source_dir=None, cache_dir=CACHE_DIR):
+    """Builds the vendored sources for arch; returns the cached binary path or None on failure."""
+    source_dir = source_dir or os.path.join(default_engine_dir(), "src")
+    target = os.path.join(cache_dir, f"stockfish-{arch}")
+    if os.path.isfile(target):
+        return target
+    if os.name == "nt" or not shutil.which("make") or not os.path.isdir(source_dir):
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as build_dir:
+        # Build in a copy so the repository stays free of object files
+        src = os.path.join(build_dir, "src")
+        shutil.copytree(source_dir, src)
+        print(f"Building Stockfish ARCH={arch} ...")
+        result = subprocess.run(["make", "-j", str(os.cpu_count() or 1), "build", f"ARCH={arch}"],
+                                cwd=src, capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.isfile(os.path.join(src, "stockfish")):
+            print(f"Build failed:\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+            return None
+        shutil.copy2(os.path.join(src, "stockfish"), target)
+    return target
+
+
+def run_bench(path):
+    """Runs the engine's built-in bench and returns its nodes/second (None if it fails)."""
+    try:
+        result = subprocess.run([path, "bench"], stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                                timeout=BENCH_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(r"Nodes/second\s*:\s*(\d+)", result.stdout + result.stderr)
+    return int(match.group(1)) if match else None
+
+
+def load_record(path=RECORD_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_record(record, path=RECORD_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+
+
+def locate_engine(engine_dir=None, build=False, bench=False, rebench=False):
+    """Path of the fastest usable engine (None if there is none).
+
+    The result is remembered per engine directory, so concurrent callers resolve it only once. With build the
+    vendored sources are compiled if no binary fits; with bench the choice is recorded with its speed."""
+    engine_dir = engine_dir or os.environ.get("CHESSBOT_ENGINE_DIR") or default_engine_dir()
+    with _locate_lock:
+        if engine_dir in _located and not (build or bench):
+            return _located[engine_dir]
+        path = _locate(engine_dir, build, bench, rebench)
+        if path is not None:
+            _located[engine_dir] = path
+        return path
+
+
+def _locate(engine_dir, build, bench, rebench):
+    archs = supported_archs()
+    path, arch = find_binary(engine_dir, archs)
+    source = "prebuilt"
+    if path is None:
+        # Built earlier with `python engine_locator.py`
+        path, arch = find_binary(CACHE_DIR, archs)
+        source = "built"
+    if path is None and build:
+        for arch in archs:
+            path = build_engine(arch)
+            if path is not None:
+                source = "built"
+                break
+    if path is None:
+        return None
+
+    record = load_record()
+    mtime = os.path.getmtime(path)
+    if bench and (rebench or record.get("path") != path or record.get("mtime") != mtime):
+        record = {"path": path, "arch": arch, "source": source, "mtime": mtime,
+                  "supported_archs": archs, "nodes_per_second": run_bench(path)}
+        save_record(record)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find (or build) the fastest Stockfish for this CPU.")
+    parser.add_argument("--engine-dir", help="Directory with Stockfish binaries")
+    parser.add_argument("--no-build", action="store_true", help="Do not build from the vendored sources")
+    parser.add_argument("--rebench", action="store_true", help="Run bench again even if already recorded")
+    args = parser.parse_args()
+
+    print(f"Supported ARCH targets: {', '.join(supported_archs())}")
+    path = locate_engine(args.engine_dir, build=not args.no_build, bench=True, rebench=args.rebench)
+    if path is None:
+        print("No usable engine found.")
+        sys.exit(1)
+    record = load_record()
+    print(f"Engine: {path} (ARCH={record.get('arch')}, {record.get('source')})")
+    print(f"Bench: {record.get('nodes_per_second')} nodes/second")
+
+
+if __name__ == "__main__":
+    main()
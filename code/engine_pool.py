@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of warm UCI engine processes shared by the boards of one app.
+
+Engines are lent out as leases with their own option profile (Threads, Hash,
+strength, ...). The pool starts at most `size` processes and keeps the sum of
+the leased Threads below `max_threads`, so the engine CPU use stays bounded
+however many boards are open. Waiting callers are served first come, first
+served. A lease's first search sends ucinewgame (through python-chess's game
+argument). Options the previous holder changed are set back when the next lease
+does not set them itself; Hash is kept, so a warm engine is not reallocated.
+
+@author: Robin Corbonnois
+"""
+
+import collections
+import threading
+import time
+import chess.engine
+from engine_config import detect_cores, supported_options
+from engine_locator import locate_engine
+
+DEFAULT_POOL_SIZE = 2
+
+# Interval in seconds at which a waiting acquire checks whether it was cancelled
+CANCEL_POLL = 0.05
+
+
+class EngineLease:
+    """One engine lent out by the pool; pass `game` to searches so a new lease starts a new game."""
+
+    def __init__(self, pool, engine, threads, changed=()):
+        self.pool = pool
+        self.engine = engine
+        self.threads = threads  # Threads counted against the pool budget
+        self.changed = set(changed)  # Options that differ from the defaults, reset by the next lease if unused
+        self.game = object()
+        self.released = False
+
+    def configure(self, options):
+        """Sets options the engine knows (automatically managed ones like MultiPV are skipped)."""
+        options = {name: value for name, value in supported_options(self.engine, options).items()
+                   if name.lower() not in chess.engine.MANAGED_OPTIONS}
+        if "Threads" in options:
+            options["Threads"] = min(int(options["Threads"]), self.threads)  # Never above the leased budget
+        if options:
+            self.engine.configure(options)
+            self.changed.update(options)
+
+    def new_game(self):
+        """The next search sends ucinewgame (clears the engine's hash and history)."""
+        self.game = object()
+
+    def analysis(self, board, limit=None, **kwargs):
+        return self.engine.analysis(board, limit, game=self.game, **kwargs)
+
+    def analyse(self, board, limit, **kwargs):
+        return self.engine.analyse(board, limit, game=self.game, **kwargs)
+
+    def play(self, board, limit, **kwargs):
+        return self.engine.play(board, limit, game=self.game, **kwargs)
+
+    def release(self, discard=False):
+        """Returns the engine to the pool (discard=True: the process is broken and is closed)."""
+        if not self.released:
+            self.released = True
+            self.pool.release(self, discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release(discard=isinstance(exc, chess.engine.EngineTerminatedError))
+
+
+class EnginePool:
+    """Lends out up to `size` warm engines; the leased Threads never exceed `max_threads`."""
+
+    def __init__(self, engine_path=None, size=DEFAULT_POOL_SIZE, max_threads=None):
+        self.engine_path = engine_path  # None: the fastest binary for this CPU is located on first use
+        self.size = size
+        self.max_threads = max_threads or detect_cores()
+        self.idle = []  # Warm engines waiting for a lease
+        self.processes = 0  # Engines started (idle and leased)
+        self.threads_in_use = 0
+        self.waiting = collections.deque()  # Tickets of callers waiting in acquire, oldest first
+        self.changed = {}  # Idle engine -> options its last lease changed
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def acquire(self, options=None, timeout=None, cancelled=None):
+        """Lends out an engine configured with options; waits (first come, first served) if none is free.
+
+        Raises TimeoutError if no engine became free within timeout seconds, or as soon as the optional
+        callable cancelled returns True."""
+        options = dict(options or {})
+        threads = max(1, min(int(options.get("Threads", 1)), self.max_threads))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            try:
+                while not self.can_lend(ticket, threads):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No engine became free in time")
+                    if cancelled is not None:
+                        if cancelled():
+                            raise TimeoutError("Waiting for an engine was cancelled")
+                        remaining = CANCEL_POLL if remaining is None else min(remaining, CANCEL_POLL)
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()  # The next caller in line may be served now
+            self.threads_in_use += threads
+            engine = self.idle.pop() if self.idle else None
+            changed = self.changed.pop(engine, set()) if engine is not None else set()
+            if engine is None:
+                self.processes += 1  # Reserve the slot; the process is started outside the lock
+
+        try:
+            if engine is not None and not self.healthy(engine):
+                self.close_engine(engine)
+                engine = None
+            if engine is None:
+                engine = self.start_engine()
+                changed = set()
+            # Reset what the previous holder changed and this lease leaves out; setting the same value again is free
+            stale = {name for name in changed if name not in options and name != "Hash"}
+            if stale:
+                engine.configure({name: engine.options[name].default for name in stale})
+            lease = EngineLease(self, engine, threads, changed - stale)
+            lease.configure(dict(options, Threads=threads))
+            return lease
+        except Exception:
+            if engine is not None:
+                self.close_engine(engine)
+            with self.condition:
+                self.processes -= 1
+                self.threads_in_use -= threads
+                self.condition.notify_all()
+            raise
+
+    def can_lend(self, ticket, threads):
+        if self.closed:
+            raise RuntimeError("Engine pool is closed")
+        return (self.waiting[0] is ticket and self.threads_in_use + threads <= self.max_threads
+                and (self.idle or self.processes < self.size))
+
+    def release(self, lease, discard=False):
+        """Takes an engine back warm (its options are reset lazily by the next lease), or closes it if broken."""
+        engine = lease.engine
+        with self.condition:
+            self.threads_in_use -= lease.threads
+            if discard or self.closed:
+                self.processes -= 1
+            else:
+                self.idle.append(engine)
+                self.changed[engine] = lease.changed
+            self.condition.notify_all()
+        if discard or self.closed:
+            self.close_engine(engine)
+
+    def start_engine(self):
+        if self.engine_path is None:
+            self.engine_path = locate_engine()
+            if self.engine_path is None:
+                raise FileNotFoundError("No Stockfish binary found for this CPU")
+        return chess.engine.SimpleEngine.popen_uci(self.engine_path)
+
+    @staticmethod
+    def healthy(engine):
+        """Health check before lending out: the process must answer isready."""
+        try:
+            engine.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def close_engine(engine):
+        try:
+            engine.quit()
+        except Exception:
+            engine.close()
+
+    def close(self):
+        """Quits the idle engines; leased ones are quit when they are returned."""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.changed.clear()
+            self.processes -= len(idle)
+            self.condition.notify_all()
+        for engine in idle:
+            self.close_engine(engine)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived Stockfish session shared by the chess apps.
+
+@author: Robin Corbonnois
+"""
+
+import threading
+import chess
+import chess.engine
+from engine_config import supported_options
+from engine_locator import locate_engine
+
+
+class EngineSession:
+    """Owns one UCI engine process: started lazily, restarted if it dies, closed on exit.
+
+    With a pool, the engine is leased from the EnginePool instead of started, and given back on close.
+    Searches then run through the lease, so the first one on a new lease sends ucinewgame."""
+
+    def __init__(self, engine_path=None, options=None, pool=None):
+        self.engine_path = engine_path  # None: pick the fastest binary for this CPU on first use
+        self.options = dict(options or {})
+        self.pool = pool
+        self.lease = None
+        self.engine = None
+        self.lock = threading.Lock()  # Protects start/restart/close against concurrent callers
+
+    def get_engine(self, cancelled=None):
+        """Returns the running engine, starting it on first use (see lease_engine for cancelled)."""
+        if self.pool is not None:
+            return self.lease_engine(cancelled).engine
+        with self.lock:
+            if self.engine is None:
+                if self.engine_path is None:
+                    self.engine_path = locate_engine()
+                    if self.engine_path is None:
+                        raise FileNotFoundError("No Stockfish binary found for this CPU")
+                engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+                if self.options:
+                    engine.configure(supported_options(engine, self.options))
+                self.engine = engine
+            return self.engine
+
+    def lease_engine(self, cancelled=None):
+        """Leases an engine from the pool; the lock is not held while waiting, so close/restart never block.
+
+        The wait ends with TimeoutError once the optional callable cancelled returns True."""
+        with self.lock:
+            if self.lease is not None:
+                return self.lease
+        lease = self.pool.acquire(self.options, cancelled=cancelled)  # May wait until the pool has a free engine
+        with self.lock:
+            if self.lease is None:
+                self.lease = lease
+                self.engine = lease.engine
+                return lease
+            current = self.lease
+        lease.release()  # Another caller leased one in the meantime
+        return current
+
+    def searcher(self):
+        """What searches run on: the lease (passes its game, see EngineLease) or the engine itself."""
+        if self.pool is not None:
+            return self.lease_engine()
+        return self.get_engine()
+
+    def restart(self):
+        """Throws away the current process so the next call starts a fresh one."""
+        with self.lock:
+            engine, self.engine = self.engine, None
+            lease, self.lease = self.lease, None
+        if lease is not None:
+            lease.release(discard=True)
+        elif engine is not None:
+            try:
+                engine.close()
+            except Exception:
+                pass  # The process is already gone
+
+    def call(self, func):
+        """Runs func(searcher), restarting the engine once if the process has died."""
+        try:
+            return func(self.searcher())
+        except chess.engine.EngineTerminatedError:
+            self.restart()
+            return func(self.searcher())
+
+    def analyse(self, board, limit, **kwargs):
+        """Analyses a position on the warm engine (hash table is kept between calls)."""
+        return self.call(lambda engine: engine.analyse(board, limit, **kwargs))
+
+    def play(self, board, limit, **kwargs):
+        """Asks the warm engine for a move."""
+        return self.call(lambda engine: engine.play(board, limit, **kwargs))
+
+    def close(self):
+        """Shuts the engine down cleanly, or returns it to the pool (safe to call several times)."""
+        with self.lock:
+            engine, self.engine = self.engine, None
+            lease, self.lease = self.lease, None
+        if lease is not None:
+            lease.release()
+        elif engine is not None:
+            try:
+                engine.quit()
+            except Exception:
+                engine.close()
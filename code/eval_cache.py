@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory evaluation cache keyed by the Zobrist hash of a position.
+
+@author: Robin Corbonnois
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+import chess
+import chess.polyglot
+
+# Default memory cap for the cache
+DEFAULT_CACHE_MB = 32
+
+# Rough memory cost of one entry and of each PV move (dict slot, tuple, PovScore, Move objects)
+ENTRY_BYTES = 400
+PV_MOVE_BYTES = 64
+
+CacheEntry = namedtuple("CacheEntry", ["score", "depth", "pv", "best_move"])
+
+
+class EvalCache:
+    """LRU cache of engine evaluations (score, depth, PV, best move) with a memory cap."""
+
+    def __init__(self, max_mb=DEFAULT_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()  # zobrist key -> CacheEntry, least recently used first
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # The analysis worker writes while the Tk thread reads
+
+    @staticmethod
+    def key(board):
+        """Zobrist hash of the position (pieces, side to move, castling, en passant)."""
+        return chess.polyglot.zobrist_hash(board)
+
+    @staticmethod
+    def entry_size(entry):
+        return ENTRY_BYTES + PV_MOVE_BYTES * len(entry.pv)
+
+    def get(self, board):
+        """Returns the cached entry for board, or None."""
+        key = self.key(board)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, board, info):
+        """Stores an engine info dict for board unless a deeper result is already cached."""
+        if "score" not in info:
+            return
+        pv = list(info.get("pv", []))
+        entry = CacheEntry(info["score"], info.get("depth", 0), pv, pv[0] if pv else None)
+        key = self.key(board)
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None:
+                if old.depth > entry.depth:
+                    self.entries.move_to_end(key)
+                    return
+                self.size_bytes -= self.entry_size(old)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.size_bytes += self.entry_size(entry)
+            while self.size_bytes > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size_bytes -= self.entry_size(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-game analysis for the Tk app: every position of a game is evaluated in
+the background on several engine processes at once.
+
+Results are handed back through a queue as (ply, info) pairs, like the
+AnalysisWorker does for single positions, so the Tk loop can poll them.
+
+@author: Robin Corbonnois
+"""
+
+import queue
+import threading
+from analysis_store import engine_name
+from engine_session import EngineSession
+
+# Engine processes used for one game (each with one search thread)
+DEFAULT_WORKERS = 4
+
+
+class GameAnalysis:
+    """Evaluates a list of boards in parallel; results arrive in results as (ply, info or None)."""
+
+    def __init__(self, boards, limit, engine_path=None, options=None, workers=DEFAULT_WORKERS, cache=None, store=None,
+                 pool=None):
+        self.limit = limit
+        self.cache = cache  # Optional EvalCache shared with the advantage bar
+        self.store = store  # Optional AnalysisStore shared with the advantage bar
+        self.boards = [board.copy() for board in boards]
+        self.results = queue.Queue()
+        self.tasks = queue.Queue()  # Plies still to evaluate, in game order
+        for ply in range(len(self.boards)):
+            self.tasks.put(ply)
+        self.total = len(self.boards)
+        self.stopped = threading.Event()
+        options = dict(options or {})
+        # The analysis profile's hash is split between the processes; parallelism comes from the processes
+        hash_mb = max(16, int(options.get("Hash", 16 * workers)) // workers)
+        options.update({"Threads": 1, "Hash": hash_mb})
+        # With a pool, the workers lease its warm engines (and wait if its thread budget is used up)
+        self.threads = [threading.Thread(target=self.run_worker, args=(EngineSession(engine_path, options, pool),),
+                                         daemon=True)
+                        for _ in range(max(1, min(workers, self.total)))]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stops after the positions being searched now; does not wait."""
+        self.stopped.set()
+
+    def running(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def run_worker(self, session):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    ply = self.tasks.get_nowait()
+                except queue.Empty:
+                    return
+                self.results.put((ply, self.evaluate(session, self.boards[ply])))
+        finally:
+            session.close()
+
+    def evaluate(self, session, board):
+        """Engine info for one position (from the store if it was analysed deep enough before)."""
+        if board.is_game_over():
+            return {}  # Nothing to search; the caller scores finished games itself
+        try:
+            engine = session.get_engine()
+            if self.store is not None and self.limit.depth is not None:
+                lines = self.store.lookup(board, engine_name(engine), min_depth=self.limit.depth)
+                if lines:
+                    return lines[0]
+            info = session.analyse(board, self.limit)
+        except Exception as e:
+            print(f"Engine error: {str(e)}")
+            return None
+        if self.cache is not None:
+            self.cache.put(board, info)
+        if self.store is not None:
+            self.store.save(board, engine_name(engine), info)
+        return info
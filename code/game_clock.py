@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Chess clock for two sides based on time.monotonic() timestamps.
+
+The remaining time is computed from the moment the running side's turn began,
+so it stays exact no matter how late the display refresh runs. Supports a
+Fischer increment and a simple (US) delay per move.
+
+@author: Robin Corbonnois
+"""
+
+import math
+import time
+import chess
+
+# Below this many seconds the display shows tenths
+TENTHS_BELOW = 10
+
+
+class GameClock:
+    """Remaining time of both sides; only the side to move is running."""
+
+    def __init__(self, initial, increment=0.0, delay=0.0, now=time.monotonic):
+        self.remaining = {chess.WHITE: float(initial), chess.BLACK: float(initial)}
+        self.increment = {chess.WHITE: float(increment), chess.BLACK: float(increment)}
+        self.delay = float(delay)
+        self.now = now
+        self.running = None  # Side whose clock is running (None: stopped)
+        self.turn_started = None
+
+    def set_increment(self, side, increment):
+        self.increment[side] = float(increment)
+
+    def used(self, side):
+        """Time charged to side in the current turn (the delay is free)."""
+        if self.running != side:
+            return 0.0
+        return max(0.0, self.now() - self.turn_started - self.delay)
+
+    def time_left(self, side):
+        return max(0.0, self.remaining[side] - self.used(side))
+
+    def start(self, side):
+        """Starts side's clock (the other one is stopped)."""
+        self.stop()
+        self.running = side
+        self.turn_started = self.now()
+
+    def stop(self):
+        """Stops the running clock and books its time."""
+        if self.running is not None:
+            self.remaining[self.running] = self.time_left(self.running)
+        self.running = None
+        self.turn_started = None
+
+    def press(self):
+        """The running side has moved: book its time, add its increment and start the opponent.
+
+        Returns the time the move took."""
+        side = self.running
+        if side is None:
+            return 0.0
+        elapsed = self.now() - self.turn_started
+        self.stop()
+        self.remaining[side] += self.increment[side]
+        self.start(not side)
+        return elapsed
+
+    def flagged(self):
+        """The side whose time ran out, or None."""
+        if self.running is not None and self.time_left(self.running) <= 0:
+            return self.running
+        return None
+
+    def until_change(self):
+        """Seconds until the display of the running side changes (or the flag falls)."""
+        if self.running is None:
+            return None
+        left = self.time_left(self.running)
+        step = 0.1 if left <= TENTHS_BELOW else 1.0
+        wait = left - math.floor(left / step - 1e-9) * step if left > 0 else 0.0
+        if self.delay:
+            wait += max(0.0, self.turn_started + self.delay - self.now())
+        return max(0.01, wait)
+
+
+def format_time(seconds):
+    """mm:ss, with tenths in the last seconds (rounded up so 0.0 only shows once the flag falls)."""
+    if seconds <= TENTHS_BELOW:
+        tenths = math.ceil(seconds * 10 - 1e-9) / 10
+        return f"{int(tenths // 60):02d}:{tenths % 60:04.1f}"
+    minutes, secs = divmod(math.ceil(seconds - 1e-9), 60)
+    return f"{minutes:02d}:{secs:02d}"
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Polyglot opening book, consulted before the engine.
+
+The book file is memory-mapped (chess.polyglot.MemoryMappedReader), so a
+lookup is a binary search in the file and takes microseconds. The bot picks
+book moves at random, weighted by the book weights raised to a per-difficulty
+exponent (0: every book move equally likely, higher: mostly the main lines).
+
+A book can be built from a local PGN collection:
+    python opening_book.py build games.pgn -o repertoire.bin --depth 20 --min-games 2
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import os
+import random
+import struct
+from collections import defaultdict
+import chess
+import chess.pgn
+import chess.polyglot
+
+# Book used when no path is given (CHESSBOT_BOOK overrides it)
+DEFAULT_BOOK_PATH = os.environ.get("CHESSBOT_BOOK") or os.path.join(os.path.expanduser("~"), ".chessbot_br", "book.bin")
+
+# Plies from the start position for which the book is consulted
+DEFAULT_BOOK_DEPTH = 20
+
+ENTRY_STRUCT = struct.Struct(">QHHI")  # key, move, weight, learn
+MAX_WEIGHT = 0xFFFF
+
+# Score of a game for the side that played the move (white win, draw, black win)
+RESULT_POINTS = {"1-0": (2, 0), "1/2-1/2": (1, 1), "0-1": (0, 2)}
+
+
+class OpeningBook:
+    """Read-only Polyglot book; does nothing if the file does not exist."""
+
+    def __init__(self, path=DEFAULT_BOOK_PATH, depth=DEFAULT_BOOK_DEPTH):
+        self.path = path
+        self.depth = depth
+        self.reader = None
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.reader = chess.polyglot.open_reader(path)
+
+    def __bool__(self):
+        return self.reader is not None
+
+    def entries(self, board, depth=None):
+        """Book entries of the position (within the book depth), best weight first."""
+        if self.reader is None or board.ply() >= (self.depth if depth is None else depth):
+            return []
+        return sorted(self.reader.find_all(board), key=lambda entry: entry.weight, reverse=True)
+
+    def choose(self, board, exponent=1.0, depth=None, rng=random):
+        """A book move chosen with probability weight ** exponent, or None out of book."""
+        entries = self.entries(board, depth)
+        if not entries:
+            return None
+        weights = [max(entry.weight, 1) ** exponent for entry in entries]
+        return rng.choices(entries, weights=weights)[0].move
+
+    def describe(self, board, limit=3):
+        """Short text with the most played book moves and their share, e.g. 'e4 45%, d4 35%'."""
+        entries = self.entries(board)
+        total = sum(entry.weight for entry in entries) or 1
+        return ", ".join(f"{board.san(entry.move)} {100 * entry.weight // total}%" for entry in entries[:limit])
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def encode_move(board, move):
+    """Polyglot move encoding (castling is written as king takes rook)."""
+    to_square = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_square = chess.square(7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0, rank)
+    promotion = move.promotion - 1 if move.promotion else 0  # knight=1 ... queen=4
+    return (chess.square_file(to_square) | chess.square_rank(to_square) << 3
+            | chess.square_file(move.from_square) << 6 | chess.square_rank(move.from_square) << 9 | promotion << 12)
+
+
+def build_book(pgn_path, output_path, depth=DEFAULT_BOOK_DEPTH, min_games=1):
+    """Builds a Polyglot book from the first depth plies of every game; returns the number of entries."""
+    points = defaultdict(int)  # (key, move) -> score points for the side that played it
+    games = defaultdict(int)  # (key, move) -> number of games
+    with open(pgn_path, encoding="utf-8", errors="replace") as pgn_file:
+        while True:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                break
+            result = RESULT_POINTS.get(game.headers.get("Result"))
+            if result is None or game.headers.get("Variant", "Standard").lower() not in ("standard", "chess"):
+                continue
+            board = game.board()
+            for move in game.mainline_moves():
+                if board.ply() >= depth:
+                    break
+                entry = (chess.polyglot.zobrist_hash(board), encode_move(board, move))
+                points[entry] += result[0] if board.turn == chess.WHITE else result[1]
+                games[entry] += 1
+                board.push(move)
+
+    entries = [(key, move, points[(key, move)]) for (key, move), count in games.items() if count >= min_games]
+    # Weights are scaled into 16 bits; moves that never scored keep weight 1 so they stay playable
+    top = max((score for _, _, score in entries), default=1) or 1
+    scale = min(1.0, MAX_WEIGHT / top)
+    entries.sort()
+    with open(output_path, "wb") as f:
+        for key, move, score in entries:
+            f.write(ENTRY_STRUCT.pack(key, move, max(1, int(score * scale)), 0))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polyglot opening books for the chess apps.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build a book from a PGN collection")
+    build.add_argument("pgn", help="PGN file with the repertoire games")
+    build.add_argument("-o", "--output", default=DEFAULT_BOOK_PATH, help="Book file to write")
+    build.add_argument("--depth", type=int, default=DEFAULT_BOOK_DEPTH, help="Plies per game taken into the book")
+    build.add_argument("--min-games", type=int, default=1, help="Leave out moves played in fewer games")
+    probe = subparsers.add_parser("probe", help="List the book moves of a position")
+    probe.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    probe.add_argument("-b", "--book", default=DEFAULT_BOOK_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        count = build_book(args.pgn, args.output, depth=args.depth, min_games=args.min_games)
+        print(f"{count} book entries written to {args.output}")
+    else:
+        board = chess.Board(args.fen)
+        book = OpeningBook(args.book, depth=board.ply() + 1)
+        for entry in book.entries(board):
+            print(f"{board.san(entry.move):8} weight {entry.weight}")
+        book.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Byte-offset index for large PGN databases.
+
+The PGN file is scanned once through mmap; the offset of every game and a few
+headers are written to an SQLite file next to it (<file>.pgn.index). Opening a
+game then only reads that game's bytes, and filtering/sorting run as SQL, so
+memory use does not depend on the size of the database.
+
+@author: Robin Corbonnois
+"""
+
+import io
+import mmap
+import os
+import re
+import sqlite3
+import chess.pgn
+
+# Headers kept in the index (column name -> PGN tag)
+INDEXED_HEADERS = {"white": "White", "black": "Black", "result": "Result", "eco": "ECO", "date": "Date"}
+SORT_COLUMNS = ["id", "white", "black", "result", "eco", "date"]
+
+HEADER_RE = re.compile(rb'^\[([A-Za-z0-9_]+)\s+"(.*)"\]\s*$')
+INSERT_BATCH = 10000  # Rows written per transaction while building
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    white TEXT, black TEXT, result TEXT, eco TEXT, date TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class PgnIndex:
+    """Index of game offsets and headers of one PGN file, persisted next to it."""
+
+    def __init__(self, pgn_path, index_path=None):
+        self.pgn_path = pgn_path
+        self.index_path = index_path or pgn_path + ".index"
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        if not self.is_current():
+            self.build()
+
+    def file_signature(self):
+        stat = os.stat(self.pgn_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def is_current(self):
+        """True if the stored index was built from the file as it is now."""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        return row is not None and row[0] == self.file_signature()
+
+    def build(self):
+        """Scans the whole file once and (re)writes the index."""
+        self.connection.execute("DELETE FROM games")
+        self.connection.commit()
+        if os.path.getsize(self.pgn_path) > 0:
+            with open(self.pgn_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self.scan(mm)
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (self.file_signature(),))
+        self.connection.commit()
+
+    def scan(self, mm):
+        rows = []
+        current = None
+        in_headers = False
+        position = 0
+        while True:
+            line = mm.readline()
+            if not line:
+                break
+            line_start = position
+            position += len(line)
+            stripped = line.strip().lstrip(b"\xef\xbb\xbf")
+            match = HEADER_RE.match(stripped)
+            if match:
+                if not in_headers:
+                    # A header block after movetext (or at the file start) begins a new game
+                    if current is not None:
+                        current["end"] = line_start
+                        rows.append(current)
+                    current = {"start": line_start, "end": None}
+                    in_headers = True
+                tag = match.group(1).decode("utf-8", "replace")
+                for column, header in INDEXED_HEADERS.items():
+                    if tag == header:
+                        current[column] = match.group(2).decode("utf-8", "replace")
+            elif stripped:
+                in_headers = False
+            if len(rows) >= INSERT_BATCH:
+                self.insert(rows)
+                rows = []
+        if current is not None:
+            current["end"] = position
+            rows.append(current)
+        self.insert(rows)
+
+    def insert(self, rows):
+        self.connection.executemany(
+            "INSERT INTO games (start, end, white, black, result, eco, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(row["start"], row["end"]) + tuple(row.get(column) for column in INDEXED_HEADERS) for row in rows])
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    @staticmethod
+    def where(text=None, result=None, eco=None):
+        """SQL WHERE clause and parameters of a game filter."""
+        conditions = []
+        parameters = []
+        if text:
+            conditions.append("(white LIKE ? OR black LIKE ?)")
+            parameters += [f"%{text}%", f"%{text}%"]
+        if result:
+            conditions.append("result = ?")
+            parameters.append(result)
+        if eco:
+            conditions.append("eco LIKE ?")
+            parameters.append(f"{eco}%")
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def count(self, text=None, result=None, eco=None):
+        """Number of games matching the filter (for paging)."""
+        where, parameters = self.where(text, result, eco)
+        return self.connection.execute("SELECT COUNT(*) FROM games" + where, parameters).fetchone()[0]
+
+    def query(self, text=None, result=None, eco=None, order_by="id", descending=False, limit=200, offset=0):
+        """Returns header dicts (with 'id') of matching games, sorted and paged."""
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by}")
+        where, parameters = self.where(text, result, eco)
+        sql = "SELECT id, white, black, result, eco, date FROM games" + where
+        sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}, id LIMIT ? OFFSET ?"
+        rows = self.connection.execute(sql, parameters + [limit, offset]).fetchall()
+        return [dict(zip(SORT_COLUMNS, row)) for row in rows]
+
+    def read_game(self, game_id):
+        """Parses only the bytes of one game."""
+        row = self.connection.execute("SELECT start, end FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            raise KeyError(game_id)
+        start, end = row
+        with open(self.pgn_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[start:end]
+        return chess.pgn.read_game(io.StringIO(data.decode("utf-8", "replace")))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Headless bot-vs-bot self-play for strength and speed regressions.
+
+Difficulty levels (or engine configurations of a level) play each other in
+parallel processes without Tk. Each bot picks its moves like chessbot.py:
+opening book, then Syzygy tables, then an engine search with the limits of its
+level (bot_levels.py). Every opening is played twice with colours swapped.
+Pondering and the analysis store of the app are not used, so the results do
+not depend on what was analysed on this machine before.
+
+Examples:
+    python self_play.py einfach mittel schwer --engine ./stockfish --games 200 --openings openings.epd
+    python self_play.py schwer "schwer,Hash=256,Threads=2" --engine ./stockfish --tc 60+0.5 -o result.json
+
+A player is a level name followed by engine options to override
+("schwer,Hash=256"); "engine=PATH" gives the player another engine binary.
+Without --engine the fastest Stockfish for this CPU is used (see engine_locator.py).
+Reported per pairing: score, Elo difference with 95% error bars and the
+likelihood of superiority; per player: average move latency, nodes per second
+and time-forfeit rate.
+
+@author: Robin Corbonnois
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import multiprocessing.util
+import os
+import random
+import time
+import chess
+import chess.engine
+import chess.pgn
+from bot_levels import DIFFICULTY_SETTINGS, search_limit
+from engine_config import load_config, supported_options
+from engine_locator import locate_engine
+from game_clock import GameClock
+from opening_book import OpeningBook
+from tablebase import TablebaseProber
+
+# Games longer than this many plies are adjudicated as a draw
+MAX_PLIES = 300
+
+# Without a clock, a move that takes longer than the level's time plus this margin loses on time
+MOVE_OVERHEAD = 0.1
+
+# Hash per engine in MB (one search thread per engine; parallelism comes from the processes)
+DEFAULT_HASH = 16
+
+_players = None  # Players of the match, shared by all games of the worker process
+_engines = {}  # Player index -> engine of the current pool worker process
+_book = None
+_tablebase = None
+
+
+def parse_player(spec):
+    """'schwer,Hash=256,engine=./sf' -> {"name", "level", "settings", "options", "engine"}."""
+    level, *overrides = spec.split(",")
+    if level not in DIFFICULTY_SETTINGS:
+        raise ValueError(f"Unknown level '{level}' (choose from {', '.join(DIFFICULTY_SETTINGS)})")
+    options = {}
+    engine_path = None
+    for override in overrides:
+        name, _, value = override.partition("=")
+        if name == "engine":
+            engine_path = value
+        elif value.lower() in ("true", "false"):
+            options[name] = value.lower() == "true"
+        else:
+            try:
+                options[name] = int(value)
+            except ValueError:
+                options[name] = value
+    return {"name": spec, "level": level, "settings": DIFFICULTY_SETTINGS[level], "options": options, "engine": engine_path}
+
+
+def parse_time_control(text):
+    """'60+0.5' -> (60.0, 0.5); None without a clock."""
+    if not text:
+        return None
+    initial, _, increment = text.partition("+")
+    return float(initial), float(increment or 0)
+
+
+def read_openings(path, plies=None):
+    """(FEN, [moves]) start positions from an EPD file or from the mainlines of a PGN file."""
+    if path is None:
+        return [(chess.STARTING_FEN, [])]
+    openings = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        if path.lower().endswith(".epd"):
+            for line in f:
+                if line.strip():
+                    board, _ = chess.Board.from_epd(line)
+                    openings.append((board.fen(), []))
+        else:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                moves = [move.uci() for move in game.mainline_moves()]
+                openings.append((game.board().fen(), moves[:plies] if plies is not None else moves))
+    if not openings:
+        raise ValueError(f"No openings found in {path}")
+    return openings
+
+
+def engine_options(player, profile, hash_mb):
+    """Options of a player's engine: the app's bot profile, then the level, then the player's overrides."""
+    options = dict(profile, Threads=1, Hash=hash_mb)
+    options.update(player["settings"]["options"])
+    options.update(player["options"])
+    return options
+
+
+def init_worker(players, book_path, syzygy_path):
+    """Pool initializer: opening book and tables per worker; engines are started on first use."""
+    global _players, _book, _tablebase
+    _players = players
+    _book = OpeningBook(book_path) if book_path else None
+    _tablebase = TablebaseProber(syzygy_path)
+    multiprocessing.util.Finalize(None, close_engines, exitpriority=16)
+
+
+def close_engines():
+    for engine in _engines.values():
+        try:
+            engine.quit()
+        except Exception:
+            engine.close()
+    _engines.clear()
+
+
+def get_engine(index):
+    engine = _engines.get(index)
+    if engine is None:
+        player = _players[index]
+        engine = chess.engine.SimpleEngine.popen_uci(player["engine"])
+        engine.configure(supported_options(engine, player["options"]))
+        _engines[index] = engine
+    return engine
+
+
+def choose_move(index, board, clock, game_id, rng):
+    """(move, source, nodes) like the bot of the app: book, tablebase, then the engine."""
+    settings = _players[index]["settings"]
+    if _book:
+        move = _book.choose(board, exponent=settings["book_exponent"], depth=settings["book_depth"], rng=rng)
+        if move is not None:
+            return move, "book", 0
+    if settings["tablebase"] and _tablebase.covers(board):
+        move = _tablebase.best_move(board)
+        if move is not None:
+            return move, "tablebase", 0
+    limit = search_limit(settings["time"], settings["depth"], settings["nodes"], clock)
+    result = get_engine(index).play(board, limit, game=game_id, info=chess.engine.INFO_BASIC)
+    return result.move, "engine", result.info.get("nodes", 0)
+
+
+def new_stats():
+    return {"moves": 0, "engine_moves": 0, "book_moves": 0, "tablebase_moves": 0,
+            "latency": 0.0, "max_latency": 0.0, "nodes": 0}
+
+
+def play_game(task):
+    """Pool task: plays one game and returns its record (result, termination, moves, per-player stats)."""
+    game_id, white, black, fen, opening_moves, time_control, max_plies, seed = task
+    rng = random.Random(seed)
+    board = chess.Board(fen)
+    for uci in opening_moves:
+        board.push_uci(uci)
+    start = board.copy()
+    players = {chess.WHITE: white, chess.BLACK: black}
+    stats = {white: new_stats(), black: new_stats()}
+    clock = GameClock(*time_control) if time_control else None
+    result, termination = "*", None
+    try:
+        get_engine(white), get_engine(black)  # Started before the clock runs
+    except chess.engine.EngineError as e:
+        return {"game": game_id, "white": white, "black": black, "fen": fen, "opening": len(opening_moves),
+                "moves": opening_moves, "result": "*", "termination": f"engine error: {e}", "stats": stats}
+
+    while True:
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result, termination = outcome.result(), outcome.termination.name.lower()
+            break
+        if board.ply() - start.ply() >= max_plies:
+            result, termination = "1/2-1/2", "adjudication"
+            break
+        side = board.turn
+        index = players[side]
+        if clock is not None and clock.running is None:
+            clock.start(side)
+        started = time.monotonic()
+        try:
+            move, source, nodes = choose_move(index, board, clock, game_id, rng)
+        except chess.engine.EngineError as e:
+            engine = _engines.pop(index, None)  # Started again for the next game
+            if engine is not None:
+                engine.close()
+            result, termination = "*", f"engine error: {e}"
+            break
+        latency = time.monotonic() - started
+
+        player_stats = stats[index]
+        player_stats["moves"] += 1
+        player_stats[f"{source}_moves"] += 1
+        if source == "engine":
+            player_stats["latency"] += latency
+            player_stats["max_latency"] = max(player_stats["max_latency"], latency)
+            player_stats["nodes"] += nodes
+        # Time forfeit: flag fallen on the clock, or (without a clock) the level's move time clearly exceeded
+        if clock is not None:
+            flagged = clock.time_left(side) <= 0
+            clock.press()
+        else:
+            flagged = source == "engine" and latency > _players[index]["settings"]["time"] + MOVE_OVERHEAD
+        board.push(move)
+        if flagged:
+            result, termination = ("0-1" if side == chess.WHITE else "1-0"), "time forfeit"
+            break
+
+    return {"game": game_id, "white": white, "black": black, "fen": fen, "opening": len(opening_moves),
+            "moves": [move.uci() for move in board.move_stack],
+            "result": result, "termination": termination, "stats": stats}
+
+
+def schedule(players, games, openings, time_control, max_plies, seed):
+    """Tasks for every pairing: each opening twice with colours swapped."""
+    tasks = []
+    pairs = itertools.combinations(range(len(players)), 2)
+    game_id = 0
+    for first, second in pairs:
+        for round_index in range((games + 1) // 2):
+            fen, moves = openings[round_index % len(openings)]
+            for white, black in ((first, second), (second, first)):
+                tasks.append((game_id, white, black, fen, moves, time_control, max_plies, seed + game_id))
+                game_id += 1
+    return tasks
+
+
+def score_to_elo(score):
+    if score <= 0 or score >= 1:
+        return None  # Only wins or only losses: the difference cannot be measured
+    return 400 * math.log10(score / (1 - score))
+
+
+def elo_difference(wins, draws, losses):
+    """(Elo difference, 95% error margin, likelihood of superiority) of a match result."""
+    games = wins + draws + losses
+    if not games:
+        return None, None, None
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    elo = score_to_elo(score)
+    lower, upper = score_to_elo(score - margin), score_to_elo(score + margin)
+    error = (upper - lower) / 2 if lower is not None and upper is not None else None
+    los = 0.5 * (1 + math.erf((wins - losses) / math.sqrt(2 * (wins + losses)))) if wins + losses else 0.5
+    return elo, error, los
+
+
+def summarize(players, records):
+    """Match table per pairing and speed figures per player."""
+    pairs = {}
+    for first, second in itertools.combinations(range(len(players)), 2):
+        pairs[(first, second)] = {"wins": 0, "draws": 0, "losses": 0, "errors": 0}
+    totals = [dict(new_stats(), games=0, forfeits=0) for _ in players]
+
+    for record in records:
+        white, black = record["white"], record["black"]
+        first, second = min(white, black), max(white, black)
+        pair = pairs[(first, second)]
+        if record["result"] == "*":
+            pair["errors"] += 1
+        elif record["result"] == "1/2-1/2":
+            pair["draws"] += 1
+        elif (record["result"] == "1-0") == (white == first):
+            pair["wins"] += 1
+        else:
+            pair["losses"] += 1
+        for index, player_stats in record["stats"].items():
+            total = totals[int(index)]
+            total["games"] += 1
+            total["max_latency"] = max(total["max_latency"], player_stats["max_latency"])
+            for key in ("moves", "engine_moves", "book_moves", "tablebase_moves", "latency", "nodes"):
+                total[key] += player_stats[key]
+        if record["termination"] == "time forfeit":
+            loser = white if record["result"] == "0-1" else black
+            totals[loser]["forfeits"] += 1
+
+    summary = {"pairs": [], "players": []}
+    for (first, second), pair in pairs.items():
+        elo, error, los = elo_difference(pair["wins"], pair["draws"], pair["losses"])
+        summary["pairs"].append(dict(pair, player=players[first]["name"], opponent=players[second]["name"],
+                                     elo=elo, error=error, los=los))
+    for player, total in zip(players, totals):
+        summary["players"].append({
+            "player": player["name"], "games": total["games"], "moves": total["moves"],
+            "book_moves": total["book_moves"], "tablebase_moves": total["tablebase_moves"],
+            "avg_latency": total["latency"] / total["engine_moves"] if total["engine_moves"] else None,
+            "max_latency": total["max_latency"],
+            "nps": total["nodes"] / total["latency"] if total["latency"] else None,
+            "forfeit_rate": total["forfeits"] / total["games"] if total["games"] else None,
+        })
+    return summary
+
+
+def format_number(value, pattern):
+    return format(value, pattern) if value is not None else "-".rjust(len(format(0.0, pattern)))
+
+
+def print_summary(summary):
+    print(f"{'Player':<24} {'Opponent':<24} {'W':>5} {'D':>5} {'L':>5} {'Elo':>8} {'+/-':>6} {'LOS':>6}")
+    for pair in summary["pairs"]:
+        print(f"{pair['player']:<24} {pair['opponent']:<24} {pair['wins']:>5} {pair['draws']:>5} {pair['losses']:>5} "
+              f"{format_number(pair['elo'], '+8.1f')} {format_number(pair['error'], '6.1f')} "
+              f"{format_number(pair['los'] and 100 * pair['los'], '5.1f')}%")
+        if pair["errors"]:
+            print(f"  {pair['errors']} games aborted by engine errors")
+    print()
+    print(f"{'Player':<24} {'Games':>6} {'Latency':>9} {'Max':>7} {'Nodes/s':>10} {'Forfeits':>9}")
+    for player in summary["players"]:
+        print(f"{player['player']:<24} {player['games']:>6} {format_number(player['avg_latency'], '8.3f')}s "
+              f"{format_number(player['max_latency'], '6.2f')}s {format_number(player['nps'], '10.0f')} "
+              f"{format_number(player['forfeit_rate'] and 100 * player['forfeit_rate'], '8.1f')}%")
+
+
+def write_pgn(path, players, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in sorted(records, key=lambda record: record["game"]):
+            board = chess.Board(record["fen"])
+            game = chess.pgn.Game.from_board(board)
+            game.headers["Event"] = "Self-play"
+            game.headers["Round"] = str(record["game"] + 1)
+            game.headers["White"] = players[record["white"]]["name"]
+            game.headers["Black"] = players[record["black"]]["name"]
+            game.headers["Result"] = record["result"]
+            if record["termination"]:
+                game.headers["Termination"] = record["termination"]
+            node = game
+            for uci in record["moves"]:
+                node = node.add_variation(chess.Move.from_uci(uci))
+            f.write(str(game) + "\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Let bot levels play each other without the GUI.")
+    parser.add_argument("players", nargs="+", help="Levels, optionally with engine options: schwer,Hash=256")
+    parser.add_argument("--engine", help="Path of the UCI engine (default: fastest Stockfish for this CPU)")
+    parser.add_argument("--games", type=int, default=100, help="Games per pairing (rounded up to an even number)")
+    parser.add_argument("--openings", help="EPD or PGN file with start positions")
+    parser.add_argument("--opening-plies", type=int, help="Plies taken from each PGN opening (default: the whole mainline)")
+    parser.add_argument("--tc", help="Clock per side, seconds+increment (e.g. 60+0.5); default: the fixed move time of each level")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of game processes")
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH, help="Hash size per engine in MB")
+    parser.add_argument("--book", help="Polyglot book used by the bots (default: none)")
+    parser.add_argument("--syzygy", default=load_config()["bot"].get("SyzygyPath"), help="Syzygy directories")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="Longer games are adjudicated as a draw")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the book move choice")
+    parser.add_argument("-o", "--output", help="JSON file for the summary")
+    parser.add_argument("--pgn", help="PGN file for the games")
+    args = parser.parse_args()
+
+    players = [parse_player(spec) for spec in args.players]
+    if len(players) < 2:
+        parser.error("At least two players are needed")
+    profile = load_config()["bot"]
+    engine_path = args.engine
+    if engine_path is None and any(player["engine"] is None for player in players):
+        engine_path = locate_engine()
+        if engine_path is None:
+            parser.error("no Stockfish binary found for this CPU, use --engine")
+    for player in players:
+        player["engine"] = player["engine"] or engine_path
+        player["options"] = engine_options(player, profile, args.hash)
+    openings = read_openings(args.openings, args.opening_plies)
+    time_control = parse_time_control(args.tc)
+    tasks = schedule(players, args.games, openings, time_control, args.max_plies, args.seed)
+    print(f"{len(tasks)} games, {len(openings)} openings, {args.workers} processes")
+
+    records = []
+    start_time = time.monotonic()
+    with multiprocessing.Pool(args.workers, initializer=init_worker,
+                              initargs=(players, args.book, args.syzygy)) as pool:
+        for record in pool.imap_unordered(play_game, tasks):
+            records.append(record)
+            if len(records) % max(1, len(tasks) // 20) == 0 or len(records) == len(tasks):
+                elapsed = time.monotonic() - start_time
+                print(f"{len(records)}/{len(tasks)} games, {len(records) / elapsed:.2f} games/s")
+        # Let the workers exit normally so their engines are quit (the with block would terminate them)
+        pool.close()
+        pool.join()
+
+    summary = summarize(players, records)
+    print()
+    print_summary(summary)
+    if args.output:
+        summary["settings"] = {"players": args.players, "games": len(records), "tc": args.tc,
+                               "openings": args.openings, "seed": args.seed}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.pgn:
+        write_pgn(args.pgn, players, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Syzygy endgame tablebase probing with an LRU cache of results.
+
+Positions with few enough pieces are answered from the tables (WDL and DTZ)
+instead of the engine: the bot plays the DTZ-optimal move and the analysis
+shows the exact result. The same directories are handed to the engine as
+SyzygyPath so its own search uses them too.
+
+@author: Robin Corbonnois
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+import chess
+import chess.polyglot
+import chess.syzygy
+
+# Directories with .rtbw/.rtbz files (several separated by os.pathsep); CHESSBOT_SYZYGY overrides it
+DEFAULT_SYZYGY_PATH = os.environ.get("CHESSBOT_SYZYGY") or os.path.join(os.path.expanduser("~"), ".chessbot_br", "syzygy")
+
+# Probe results kept in memory
+DEFAULT_CACHE_ENTRIES = 100000
+
+# WDL from the side to move: 2 win, 1 win spoiled by the 50-move rule, 0 draw, -1 and -2 the same for losses
+TablebaseResult = namedtuple("TablebaseResult", ["wdl", "dtz"])
+
+WDL_NAMES = {2: "win", 1: "cursed win", 0: "draw", -1: "blessed loss", -2: "loss"}
+
+
+def syzygy_directories(path):
+    """Existing directories of a SyzygyPath value (Stockfish uses '<empty>' for none)."""
+    if not path or path == "<empty>":
+        return []
+    return [directory for directory in path.split(os.pathsep) if os.path.isdir(directory)]
+
+
+class TablebaseProber:
+    """Syzygy tables of one or more directories; does nothing if no table is found."""
+
+    def __init__(self, path=DEFAULT_SYZYGY_PATH, cache_entries=DEFAULT_CACHE_ENTRIES):
+        self.tablebase = None
+        self.max_pieces = 0
+        self.cache = OrderedDict()  # zobrist key -> TablebaseResult, least recently used first
+        self.cache_entries = cache_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # Table files and cache are shared by the Tk and engine threads
+        directories = syzygy_directories(path)
+        if directories:
+            tablebase = chess.syzygy.Tablebase()
+            for directory in directories:
+                tablebase.add_directory(directory)
+            if tablebase.wdl:
+                self.tablebase = tablebase
+                # Table names like KQvKR: number of letters = number of pieces
+                self.max_pieces = max(len(name) - 1 for name in tablebase.wdl)
+        self.path = os.pathsep.join(directories)
+
+    def __bool__(self):
+        return self.tablebase is not None
+
+    def covers(self, board):
+        """True if the position can be probed (few pieces, no castling rights)."""
+        return (self.tablebase is not None and chess.popcount(board.occupied) <= self.max_pieces
+                and not board.castling_rights)
+
+    def probe(self, board):
+        """TablebaseResult for the side to move, or None if the position is not in the tables."""
+        if not self.covers(board):
+            return None
+        key = chess.polyglot.zobrist_hash(board)
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+            try:
+                result = TablebaseResult(self.tablebase.probe_wdl(board), self.tablebase.probe_dtz(board))
+            except (KeyError, chess.syzygy.MissingTableError):
+                return None
+            self.cache[key] = result
+            if len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+            return result
+
+    def best_move(self, board):
+        """DTZ-optimal move: keeps the best WDL, wins as fast and loses as slowly as possible."""
+        if self.probe(board) is None:
+            return None
+        best = None
+        best_key = None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    return move
+                child = self.probe(board)
+            finally:
+                board.pop()
+            if child is None:
+                return None  # A table for the position after the move is missing
+            # Our WDL is minus the opponent's; a larger (less negative / more positive) opponent DTZ is better for us
+            key = (-child.wdl, child.dtz)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    def close(self):
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
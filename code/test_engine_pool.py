@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the engine pool against the UCI stub (no Stockfish needed).
+
+    python -m pytest test_engine_pool.py
+
+@author: Robin Corbonnois
+"""
+
+import logging
+import os
+import sys
+import chess
+import chess.engine
+from engine_pool import EnginePool
+from engine_session import EngineSession
+
+STUB_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "uci_stub.py")]
+LIMIT = chess.engine.Limit(depth=1)
+
+
+def sent_new_games(caplog):
+    """Number of ucinewgame commands python-chess logged as sent."""
+    return sum(1 for record in caplog.records if record.getMessage().endswith("<< ucinewgame"))
+
+
+def test_fresh_lease_sends_ucinewgame(caplog):
+    caplog.set_level(logging.DEBUG, logger="chess.engine")
+    pool = EnginePool(STUB_COMMAND, size=1, max_threads=1)
+    try:
+        with pool.acquire() as lease:
+            lease.analyse(chess.Board(), LIMIT)
+            lease.analyse(chess.Board(), LIMIT)
+        assert sent_new_games(caplog) == 1
+        with pool.acquire() as lease:  # Same warm process, new holder
+            lease.analyse(chess.Board(), LIMIT)
+        assert sent_new_games(caplog) == 2
+    finally:
+        pool.close()
+
+
+def test_pooled_session_searches_through_the_lease(caplog):
+    caplog.set_level(logging.DEBUG, logger="chess.engine")
+    pool = EnginePool(STUB_COMMAND, size=1, max_threads=1)
+    try:
+        for _ in range(2):  # Each session leases the same process and must start a new game on it
+            session = EngineSession(pool=pool)
+            session.analyse(chess.Board(), LIMIT)
+            session.analyse(chess.Board(), LIMIT)
+            session.close()
+        assert sent_new_games(caplog) == 2
+    finally:
+        pool.close()
+
+
+def test_release_keeps_hash_and_resets_other_options(caplog):
+    caplog.set_level(logging.DEBUG, logger="chess.engine")
+    pool = EnginePool(STUB_COMMAND, size=1, max_threads=1)
+    try:
+        pool.acquire({"Hash": 256, "Skill Level": 5}).release()
+        pool.acquire({"Hash": 256}).release()
+        sent = [record.getMessage() for record in caplog.records if "<< setoption" in record.getMessage()]
+        assert sum("name Hash" in line for line in sent) == 1  # Not reset on release, so not sent again
+        assert sent[-1].endswith("setoption name Skill Level value 20")  # Left out by the second lease
+    finally:
+        pool.close()
+
+
+def test_waiting_acquire_can_be_cancelled():
+    pool = EnginePool(STUB_COMMAND, size=1, max_threads=1)
+    try:
+        with pool.acquire():
+            try:
+                pool.acquire(cancelled=lambda: True)
+            except TimeoutError:
+                pass
+            else:
+                raise AssertionError("acquire did not stop waiting")
+    finally:
+        pool.close()
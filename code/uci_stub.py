@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal UCI engine for benchmarks and offline runs of the tools.
+
+It speaks enough UCI for python-chess (options, isready, position, go, stop,
+ponderhit) and answers every search immediately with the first legal moves
+and a made-up score, so measured times are the cost of the GUI side and the
+UCI round-trip, not of a real search.
+
+    python benchmark.py   # starts this stub as the engine of the apps
+
+@author: Robin Corbonnois
+"""
+
+import sys
+import threading
+import chess
+
+# Options announced to the GUI (name, UCI declaration)
+OPTIONS = [
+    ("Threads", "type spin default 1 min 1 max 1024"),
+    ("Hash", "type spin default 16 min 1 max 33554432"),
+    ("MultiPV", "type spin default 1 min 1 max 500"),
+    ("Ponder", "type check default false"),
+    ("Skill Level", "type spin default 20 min 0 max 20"),
+    ("UCI_LimitStrength", "type check default false"),
+    ("UCI_Elo", "type spin default 1320 min 1320 max 3190"),
+    ("SyzygyPath", "type string default <empty>"),
+]
+
+# Depth reported when go has no depth limit
+DEFAULT_DEPTH = 5
+NODES_PER_DEPTH = 1000
+
+
+class StubEngine:
+    """Answers searches instantly; infinite and ponder searches wait for stop or ponderhit."""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.board = chess.Board()
+        self.multipv = 1
+        self.search = None  # Thread of the running search
+        self.finish = threading.Event()  # Set by stop/ponderhit to end a waiting search
+
+    def send(self, line):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    def handle(self, line):
+        """Handles one command line; returns False on quit."""
+        parts = line.split()
+        if not parts:
+            return True
+        command = parts[0]
+        if command == "uci":
+            self.send("id name UCI stub")
+            self.send("id author Robin Corbonnois")
+            for name, declaration in OPTIONS:
+                self.send(f"option name {name} {declaration}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption" and "name" in parts and "value" in parts:
+            name = " ".join(parts[parts.index("name") + 1:parts.index("value")])
+            if name == "MultiPV":
+                self.multipv = max(1, int(parts[parts.index("value") + 1]))
+        elif command == "ucinewgame":
+            self.board = chess.Board()
+        elif command == "position":
+            self.set_position(parts[1:])
+        elif command == "go":
+            self.wait_search()
+            self.finish.clear()
+            self.search = threading.Thread(target=self.go, args=(parts[1:], self.board.copy()), daemon=True)
+            self.search.start()
+        elif command in ("stop", "ponderhit"):
+            self.finish.set()
+        elif command == "quit":
+            self.finish.set()
+            return False
+        return True
+
+    def set_position(self, args):
+        if args[0] == "startpos":
+            self.board = chess.Board()
+            rest = args[1:]
+        else:
+            end = args.index("moves") if "moves" in args else len(args)
+            self.board = chess.Board(" ".join(args[1:end]))
+            rest = args[end:]
+        for uci in rest[1:]:
+            self.board.push_uci(uci)
+
+    def go(self, args, board):
+        depth = int(args[args.index("depth") + 1]) if "depth" in args else DEFAULT_DEPTH
+        moves = list(board.legal_moves)
+        if not moves:
+            self.send("info depth 0 score mate 0" if board.is_check() else "info depth 0 score cp 0")
+            self.send("bestmove (none)")
+            return
+        for line, move in enumerate(moves[:self.multipv], 1):
+            self.send(f"info depth {depth} seldepth {depth} multipv {line} score cp {20 - 10 * line} "
+                      f"nodes {depth * NODES_PER_DEPTH} nps 1000000 time 1 pv {move.uci()}")
+        if "infinite" in args or "ponder" in args:
+            self.finish.wait()
+        board.push(moves[0])
+        reply = next(iter(board.legal_moves), None)
+        self.send(f"bestmove {moves[0].uci()}" + (f" ponder {reply.uci()}" if reply else ""))
+
+    def wait_search(self):
+        if self.search is not None:
+            self.search.join()
+            self.search = None
+
+
+def main():
+    engine = StubEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.wait_search()
+
+
+if __name__ == "__main__":
+    main()